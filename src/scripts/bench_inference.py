@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import numpy as np
+from tensorflow.keras import models
+
+from inference import KERAS_BACKENDS, TFLITE_BACKENDS, TFLitePredictor, exported_path
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
+WARMUP = 10
+ITERATIONS = 200
+
+
+def time_predictor(predictor, sample, iterations=ITERATIONS, warmup=WARMUP):
+    """Measures the per-call latency of a predictor on a batch of one.
+
+    Args:
+        predictor (KerasPredictor, FastPredictor or TFLitePredictor): predictor to time
+        sample (ndarray): model input, with a batch dimension of 1
+        iterations (int, optional): number of timed calls. Defaults to ITERATIONS.
+        warmup (int, optional): number of untimed calls made first. Defaults to WARMUP.
+
+    Returns:
+        ndarray: latency of each timed call, in milliseconds
+    """
+    for _ in range(warmup):
+        predictor.predict(sample)
+    times = np.zeros(iterations)
+    for i in range(iterations):
+        t = time.perf_counter()
+        predictor.predict(sample)
+        times[i] = (time.perf_counter() - t) * 1000
+    return times
+
+
+def main(args):
+    models_dir = args[1] if len(args) > 1 else MODELS_DIR
+    backends = list(KERAS_BACKENDS) + list(TFLITE_BACKENDS)
+    print(f"{'model':<24}" + "".join(f"{b + ' p50 (ms)':>22}{b + ' mean (ms)':>22}" for b in backends))
+    for filename in sorted(os.listdir(models_dir)):
+        if not filename.endswith('.h5'):
+            continue
+        path = os.path.join(models_dir, filename)
+        model = models.load_model(path)
+        sample = np.random.rand(1, *model.input_shape[1:]).astype(np.float32)
+        predictors = [backend(model) for backend in KERAS_BACKENDS.values()]
+        for backend in TFLITE_BACKENDS:
+            # only the models that have been exported (see export_models.py)
+            tflite_path = exported_path(path, backend)
+            predictors.append(TFLitePredictor(tflite_path) if os.path.isfile(tflite_path) else None)
+
+        row = f"{filename:<24}"
+        for predictor in predictors:
+            if predictor is None:
+                row += f"{'-':>22}{'-':>22}"
+                continue
+            times = time_predictor(predictor, sample)
+            row += f"{np.median(times):>22.3f}{np.mean(times):>22.3f}"
+        print(row)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
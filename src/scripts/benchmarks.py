@@ -0,0 +1,435 @@
+#! /usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import time
+import cv2
+import numpy as np
+
+import ros_shim
+ros_shim.install()
+
+from contour_stats import top_contours
+from crosswalk import RedLineDetector
+from motion import MotionDetector
+import plate_geometry
+from hsv_view import ImageProcessor
+from pull_plate import PlatePull
+from scrape_frames import DataScraper
+
+"""
+Microbenchmarks of the perception hot paths, with a fixed number of warm-up and timed iterations.
+Results are written as json, so that they can be compared between commits, e.g.:
+    python3 benchmarks.py --out before.json
+    (checkout, change...)
+    python3 benchmarks.py --out after.json --compare before.json
+"""
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODELS_DIR = os.path.join(SRC_DIR, 'models')
+ITERATIONS = 200
+WARMUP = 20
+ROWS = 720
+COLS = 1280
+
+"""name -> setup function, taking the BenchData and returning the function to time (see benchmark)"""
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    """Raised by a benchmark's setup when it cannot run here (e.g. a model or package is missing)."""
+
+
+def benchmark(name):
+    """Registers a benchmark. The decorated setup function takes the BenchData and returns a function
+    without arguments, which is what gets timed.
+
+    Args:
+        name (str): name of the benchmark
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def time_fn(fn, iterations=ITERATIONS, warmup=WARMUP):
+    """Measures the latency of each call of a function.
+
+    Args:
+        fn (callable): function to time, called without arguments
+        iterations (int, optional): number of timed calls. Defaults to ITERATIONS.
+        warmup (int, optional): number of untimed calls made first. Defaults to WARMUP.
+
+    Returns:
+        ndarray: latency of each timed call, in milliseconds
+    """
+    for _ in range(warmup):
+        fn()
+    times = np.zeros(iterations)
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn()
+        times[i] = (time.perf_counter() - t) * 1000
+    return times
+
+
+def cycle(fn, inputs):
+    """Returns a function calling fn on the next input every time, so that a benchmark covers several inputs."""
+    it = itertools.cycle(inputs)
+    return lambda: fn(next(it))
+
+
+class BenchData:
+    """This class holds the inputs of the benchmarks: the bundled images and synthetic 1280x720 frames.
+    """
+
+    def __init__(self, seed=353):
+        rng = np.random.default_rng(seed)
+        """bundled camera frames containing a plate"""
+        plate_dir = os.path.join(SRC_DIR, 'license-plate-data')
+        self.plate_frames = [cv2.imread(os.path.join(plate_dir, f)) for f in sorted(os.listdir(plate_dir))]
+        """synthetic frames: noisy road with a white lane line, a blue car with a gray plate, a red line"""
+        self.synthetic_frames = []
+        for i in range(4):
+            frame = rng.integers(60, 110, (ROWS, COLS, 3), dtype=np.uint8)
+            cv2.line(frame, (200 + 20*i, ROWS - 1), (560, 400), (255, 255, 255), 12)
+            cv2.rectangle(frame, (700, 300), (1100, 600), (200, 40, 40), -1)
+            quad = np.int32([[820 + 5*i, 350], [980, 360 + 5*i], [975, 560], [825, 550]])
+            cv2.fillConvexPoly(frame, quad, (150, 150, 150))
+            cv2.rectangle(frame, (0, 620 + 10*i), (COLS - 1, 660 + 10*i), (0, 0, 220), -1)
+            self.synthetic_frames.append(frame)
+        self.frames = self.plate_frames + self.synthetic_frames
+        self.gray_frames = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in self.frames]
+
+    @staticmethod
+    def char_imgs(folder):
+        """Bundled character images (grayscale), as BGR images like the crops of a plate view."""
+        path = os.path.join(SRC_DIR, folder)
+        return [cv2.cvtColor(cv2.imread(os.path.join(path, f), cv2.IMREAD_GRAYSCALE), cv2.COLOR_GRAY2BGR)
+                for f in sorted(os.listdir(path))[:50]]
+
+
+@benchmark("ImageProcessor.filter")
+def bench_filter(data):
+    return cycle(lambda f: ImageProcessor.filter(f, ImageProcessor.white_low, ImageProcessor.white_up), data.frames)
+
+
+@benchmark("ImageProcessor.filter_plate")
+def bench_filter_plate(data):
+    return cycle(lambda f: ImageProcessor.filter_plate(f, ImageProcessor.plate_low, ImageProcessor.plate_up), data.frames)
+
+
+@benchmark("DataScraper.process_img")
+def bench_process_img(data):
+    return cycle(DataScraper.process_img, data.frames)
+
+
+@benchmark("DataScraper.process_img[downscale_first]")
+def bench_process_img_downscaled(data):
+    return cycle(lambda f: DataScraper.process_img(f, downscale_first=True), data.frames)
+
+
+def legacy_top_areas(mask, k=1):
+    """The top contour areas as found before contour_stats: every contour of the tree with all its points,
+    sorted by area."""
+    contours, _ = cv2.findContours(image=mask, mode=cv2.RETR_TREE, method=cv2.CHAIN_APPROX_NONE)
+    cs = sorted(contours, key=cv2.contourArea, reverse=True)[:k]
+    return [cv2.contourArea(c) for c in cs]
+
+
+@benchmark("red line[contours, full frame]")
+def bench_red_line_contours(data):
+    # the red line check before RedLineDetector
+    return cycle(lambda f: legacy_top_areas(ImageProcessor.filter_red(f), 2), data.frames)
+
+
+@benchmark("RedLineDetector.detect")
+def bench_red_line_detector(data):
+    detector = RedLineDetector(3500)
+    return cycle(detector.detect, data.frames)
+
+
+@benchmark("red line angle[Canny + HoughLinesP]")
+def bench_red_line_hough(data):
+    # the line alignment of Driver.is_straightened before RedLineDetector.fit_line
+    def hough(f):
+        edges = cv2.Canny(ImageProcessor.filter_red(f), 50, 150, apertureSize=3)
+        return cv2.HoughLinesP(image=edges, rho=1, theta=np.pi/180, threshold=100, lines=np.array([]), 
+            minLineLength=100, maxLineGap=80)
+    return cycle(hough, data.frames)
+
+
+@benchmark("RedLineDetector.fit_line")
+def bench_red_line_fit(data):
+    detector = RedLineDetector(3500)
+    return cycle(detector.fit_line, data.frames)
+
+
+@benchmark("ImageProcessor.compare_frames")
+def bench_compare_frames(data):
+    # the crosswalk view of consecutive frames
+    crops = [ImageProcessor.crop(g, 180, ROWS-180, 320, COLS-320) for g in data.gray_frames]
+    pairs = list(zip(crops, crops[1:] + crops[:1]))
+    return cycle(lambda p: ImageProcessor.compare_frames(*p), pairs)
+
+
+@benchmark("MotionDetector.update")
+def bench_motion_update(data):
+    detector = MotionDetector((180, ROWS-180, 320, COLS-320), 30, 5)
+    return cycle(detector.update, data.frames)
+
+
+def blue_masks(data):
+    """Blue masks of the lower part of the frames, the input of PlatePull.get_contours_area in the driver."""
+    return [ImageProcessor.filter_blue(ImageProcessor.crop(f, row_start=int(ROWS/2.5))) for f in data.frames]
+
+
+@benchmark("contour areas[RETR_TREE, full sort]")
+def bench_legacy_contours_area(data):
+    # PlatePull.get_contours_area before contour_stats
+    return cycle(legacy_top_areas, blue_masks(data))
+
+
+@benchmark("PlatePull.get_contours_area")
+def bench_contours_area(data):
+    return cycle(PlatePull.get_contours_area, blue_masks(data))
+
+
+@benchmark("contour_stats.top_contours[plate]")
+def bench_top_contours_plate(data):
+    masks = [ImageProcessor.filter_plate(f, ImageProcessor.plate_low, ImageProcessor.plate_up) for f in data.frames]
+    return cycle(top_contours, masks)
+
+
+def plate_reader():
+    """PlateReader without character readers, for the benchmarks that do not run the cnns."""
+    from plate_reader import PlateReader
+    return PlateReader(script_run=False, readers={"num": None, "alpha": None, "id": None})
+
+
+@benchmark("PlateReader.get_plate_view")
+def bench_get_plate_view(data):
+    return cycle(plate_reader().get_plate_view, data.frames)
+
+
+def plate_quads(reader, data):
+    """(frame, plate corners) of each frame that has a valid plate."""
+    quads = [(f, reader.get_plate_quad(f)) for f in data.frames]
+    quads = [(f, q) for f, q in quads if q is not None]
+    if not quads:
+        raise SkipBenchmark("no valid plate in the frames")
+    return quads
+
+
+@benchmark("plate model inputs[plate view, resize, resize]")
+def bench_plate_inputs_view(data):
+    # the model inputs of a plate as built before PlateReader.get_cell_imgs
+    reader = plate_reader()
+    def inputs(frame_quad):
+        view = plate_geometry.warp_plate(*frame_quad)
+        crops = [reader.plate_id_img(view)] + [reader.process_plate(i, view) for i in range(4)]
+        sizes = [(15, 30)] + [(15, 29)] * 4
+        return [cv2.cvtColor(cv2.resize(c, s), cv2.COLOR_BGR2GRAY) for c, s in zip(crops, sizes)]
+    return cycle(inputs, plate_quads(reader, data))
+
+
+@benchmark("PlateQualityScorer.score")
+def bench_plate_quality(data):
+    reader = plate_reader()
+    return cycle(lambda fq: reader.scorer.score(*fq), plate_quads(reader, data))
+
+
+@benchmark("PlateReader.get_cell_imgs")
+def bench_cell_imgs(data):
+    reader = plate_reader()
+    return cycle(lambda fq: reader.get_cell_imgs(*fq), plate_quads(reader, data))
+
+
+def plate_contours(data):
+    """Largest plate contour of each frame that has one."""
+    masks = [ImageProcessor.filter_plate(f, ImageProcessor.plate_low, ImageProcessor.plate_up) for f in data.frames]
+    contours = [top_contours(m).largest for m in masks]
+    return [c for c in contours if c is not None]
+
+
+def legacy_plate_quad(contour):
+    """The plate corners as found before plate_geometry: python loops over the flattened contour."""
+    approx = cv2.approxPolyDP(contour, 0.1*cv2.arcLength(contour, True), True)
+    n = approx.ravel()
+    coords = [(n[i], n[i + 1]) for i in range(0, len(n), 2)]
+    avg_x = int(sum(p[0] for p in coords)/4)
+    avg_y = int(sum(p[1] for p in coords)/4)
+    tl = tr = bl = br = None
+    for p in coords:
+        if int(p[1]) < avg_y and int(p[0]) < avg_x:
+            tl = p
+        elif int(p[1]) < avg_y:
+            tr = p
+        elif int(p[0]) < avg_x:
+            bl = p
+        else:
+            br = p
+    if tl is None or tr is None or bl is None or br is None:
+        return []
+    pts = np.float32([tl, tr, bl, br])
+    if 0 in pts[:, 0] or COLS-1 in pts[:, 0] or 0 in pts[:, 1] or ROWS-1 in pts[:, 1]:
+        return []
+    return pts
+
+
+@benchmark("plate corners[python loops]")
+def bench_legacy_plate_quad(data):
+    return cycle(legacy_plate_quad, plate_contours(data))
+
+
+@benchmark("plate_geometry.plate_quad")
+def bench_plate_quad(data):
+    return cycle(lambda c: plate_geometry.plate_quad(c, (ROWS, COLS)), plate_contours(data))
+
+
+def char_reader(filename, backend, cache=None):
+    """CharReader of a bundled model, skipping the benchmark if it cannot be loaded.
+    Without a prediction cache by default, so that the model runs on every call."""
+    try:
+        from char_reader import CharReader
+        return CharReader(os.path.join(MODELS_DIR, filename), backend, cache)
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+
+
+@benchmark("CharReader.predict_char[alpha]")
+def bench_predict_alpha(data):
+    reader = char_reader('alpha_model2.1.h5', data.backend)
+    return cycle(reader.predict_char, BenchData.char_imgs('alpha-edge-data'))
+
+
+@benchmark("CharReader.predict_char[alpha, cached]")
+def bench_predict_alpha_cached(data):
+    from prediction_cache import PredictionCache
+    reader = char_reader('alpha_model2.1.h5', data.backend, PredictionCache())
+    return cycle(reader.predict_char, BenchData.char_imgs('alpha-edge-data'))
+
+
+@benchmark("CharReader.predict_char[num]")
+def bench_predict_num(data):
+    reader = char_reader('num_model2.h5', data.backend)
+    return cycle(reader.predict_char, BenchData.char_imgs('num-edge-data'))
+
+
+@benchmark("Model.predict")
+def bench_model_predict(data):
+    if not data.drive_model or not os.path.isfile(data.drive_model):
+        raise SkipBenchmark(f"no drive model at {data.drive_model}")
+    try:
+        from model import Model
+        model = Model(data.drive_model, data.backend)
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    return cycle(model.predict, [DataScraper.process_img(f) for f in data.frames])
+
+
+def git_commit():
+    """Returns:
+        str: the commit the benchmarks ran on, None if unknown
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(names=None, iterations=ITERATIONS, warmup=WARMUP, backend="fast", drive_model=None):
+    """Runs the benchmarks.
+
+    Args:
+        names (list[str], optional): names of the benchmarks to run (substring match). Defaults to None (all).
+        iterations (int, optional): number of timed calls per benchmark. Defaults to ITERATIONS.
+        warmup (int, optional): number of untimed calls per benchmark. Defaults to WARMUP.
+        backend (str, optional): inference backend of the cnn benchmarks. Defaults to "fast".
+        drive_model (str, optional): path of the drive model for Model.predict. Defaults to None (skipped).
+
+    Returns:
+        dict: metadata of the run, and the stats of each benchmark in ms (or the reason it was skipped)
+    """
+    data = BenchData()
+    data.backend = backend
+    data.drive_model = drive_model
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        try:
+            fn = setup(data)
+        except SkipBenchmark as e:
+            results[name] = {"skipped": str(e)}
+            continue
+        times = time_fn(fn, iterations, warmup)
+        results[name] = {
+            "iterations": iterations,
+            "mean": round(float(np.mean(times)), 4),
+            "p50": round(float(np.median(times)), 4),
+            "p95": round(float(np.percentile(times, 95)), 4),
+            "min": round(float(np.min(times)), 4),
+            "max": round(float(np.max(times)), 4),
+        }
+    meta = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "backend": backend,
+        "warmup": warmup,
+    }
+    return {"meta": meta, "results": results}
+
+
+def print_results(results, baseline=None):
+    """Prints the results, and their change relative to a baseline run if given.
+
+    Args:
+        results (dict): results of run
+        baseline (dict, optional): results of an earlier run. Defaults to None.
+    """
+    for name, stats in results["results"].items():
+        if "skipped" in stats:
+            print(f"{name:<40}skipped: {stats['skipped']}")
+            continue
+        line = f"{name:<40}p50 {stats['p50']:>9.3f} ms  p95 {stats['p95']:>9.3f} ms  mean {stats['mean']:>9.3f} ms"
+        base = baseline["results"].get(name, {}) if baseline else {}
+        if "p50" in base:
+            line += f"  ({(stats['p50'] / base['p50'] - 1) * 100:+.1f}% p50 vs {baseline['meta'].get('commit')})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the perception microbenchmarks.')
+    parser.add_argument('names', nargs='*', help='only run the benchmarks containing one of these')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--warmup', type=int, default=WARMUP)
+    parser.add_argument('--backend', default='fast', help='inference backend of the cnn benchmarks')
+    parser.add_argument('--drive-model', default=None, help='path of a drive model, for Model.predict')
+    parser.add_argument('--out', default=None, help='json file to write the results to')
+    parser.add_argument('--compare', default=None, help='json results of an earlier run to compare to')
+    args = parser.parse_args()
+
+    results = run(args.names, args.iterations, args.warmup, args.backend, args.drive_model)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
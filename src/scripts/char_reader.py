@@ -1,18 +1,17 @@
 #! /usr/bin/env python3
 
 from __future__ import print_function
-from concurrent.futures import process
 
 #import roslib; roslib.load_manifest('node')
+import os
 import sys
 import rospy
 import cv2
 import numpy as np
 
-import tensorflow as tf
-from tensorflow.keras import models
-from tensorflow.keras.utils import plot_model
-from PIL import Image
+from inference import load_predictor
+from latency import LATENCY
+from prediction_cache import PREDICTION_CACHE
 
 
 class CharReader:
@@ -20,9 +19,25 @@ class CharReader:
 
     Requires path of the neural net file
     """
+    """input (width, height) of the character and ID models"""
+    CHAR_SIZE = (15, 29)
+    ID_SIZE = (15, 30)
 
-    def __init__(self, path):
-        self.model = models.load_model(path)
+    def __init__(self, path, backend="keras", cache=PREDICTION_CACHE):
+        """Creates a CharReader object.
+
+        Args:
+            path (str): path where the trained model is saved.
+            backend (str, optional): inference backend to run the model with (see inference.BACKENDS). Defaults to "keras".
+            cache (PredictionCache, optional): cache of the predictions, None to always run the model. 
+                Defaults to the process-wide PREDICTION_CACHE.
+        """
+        self.predictor = load_predictor(path, backend)
+        self.model = self.predictor.model
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.cache = cache
+        """identity of the model in the cache keys"""
+        self.model_key = (os.path.abspath(path), backend)
         print(type(self.model))
 
     def predict_char(self, img, id=False):
@@ -35,15 +50,53 @@ class CharReader:
         Returns:
             List: the prediction vector for each possible prediction outcome
         """        
-        if id:
-            img = self.pre_processing_for_id(img)
+        return self.predict_batch([img], id=id)[0]
+
+    def predict_batch(self, imgs, id=False, preprocessed=False):
+        """Model prediction vectors for several images, using a single call to the model.
+
+        Args:
+            imgs (list[cv::Mat]): images of a character each.
+            id (bool, optional): True if the characters are for the top ID. Defaults to False.
+            preprocessed (bool, optional): True if the images are already grayscale, at the input size of 
+                the model (CHAR_SIZE or ID_SIZE). Defaults to False.
+
+        Returns:
+            ndarray: 2D array, each row being the prediction vector of the corresponding image
+        """
+        if preprocessed:
+            batch = imgs
+        elif id:
+            batch = [self.pre_processing_for_id(img) for img in imgs]
         else:
-            img = self.pre_processing_for_model(img)
-        img = img/255
-        img_aug = np.expand_dims(np.expand_dims(img, axis=-1), axis=0)
-        y_predict = self.model.predict(img_aug)[0]
+            batch = [self.pre_processing_for_model(img) for img in imgs]
+        if self.cache is None:
+            return self.predict_preprocessed(batch)
+
+        keys = [self.cache.keys(self.model_key, img) for img in batch]
+        preds = [self.cache.get(img_keys, img) for img_keys, img in zip(keys, batch)]
+        misses = [i for i, pred in enumerate(preds) if pred is None]
+        if misses:
+            # the model only runs on the crops not seen before
+            miss_preds = self.predict_preprocessed([batch[i] for i in misses])
+            for i, pred in zip(misses, miss_preds):
+                preds[i] = pred
+                self.cache.put(keys[i][0], batch[i], np.array(pred))
+        return np.array(preds)
+
+    def predict_preprocessed(self, batch):
+        """Runs the model on preprocessed images.
+
+        Args:
+            batch (list[cv::Mat]): grayscale images at the input size of the model
 
-        return y_predict
+        Returns:
+            ndarray: 2D array, each row being the prediction vector of the corresponding image
+        """
+        batch = np.array(batch)/255
+        batch = np.expand_dims(batch, axis=-1)
+        with LATENCY.stage(f"{self.name} inference"):
+            return self.predictor.predict(batch)
 
     @staticmethod
     def interpret(predict_vec, debug=False):
@@ -84,7 +137,7 @@ class CharReader:
             image: formatted image
         """
 
-        resize = cv2.resize(im, (15, 30))
+        resize = cv2.resize(im, CharReader.ID_SIZE)
         gray = cv2.cvtColor(resize, cv2.COLOR_BGR2GRAY)
 
         return gray
@@ -98,7 +151,7 @@ class CharReader:
         Returns:
             image: formatted image
         """
-        resize = cv2.resize(im, (15, 29))
+        resize = cv2.resize(im, CharReader.CHAR_SIZE)
         gray = cv2.cvtColor(resize, cv2.COLOR_BGR2GRAY)
 
         return gray
@@ -109,6 +162,7 @@ class CharReader:
 
 
 def main(args):
+    from PIL import Image
     path = '/home/fizzer/ros_ws/ENPH353-Team12/src/models/license_plate_model1.h5'
     print('***** initializing reader *****')
     cr = CharReader(path)
@@ -129,6 +183,7 @@ def main(args):
 
 
 if __name__ == '__main__':
+    from tensorflow.keras import models
     path = '/home/fizzer/ros_ws/src/models/license_plate_model1.h5'
     print('***** loading model *****')
     model = models.load_model(path)
@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+
+import argparse
+import sys
+import cv2
+import numpy as np
+
+import ros_shim
+ros_shim.install()
+
+from driver import Driver
+from motion import MotionDetector
+from replay import iter_frames
+
+"""
+Checks that the motion detectors of the driver (downsampled and averaged, see MotionDetector) see the same
+moving and still events as the full resolution mse of the last two frames, with the thresholds first tuned on
+it (REFERENCE_THRES), on recorded frames of the robot stopped at a crosswalk or at the truck intersection.
+Without frames, synthetic scenes are checked (a pedestrian crossing at different speeds, a truck passing).
+e.g.:
+    python3 check_motion.py crosswalk ~/crosswalk-frames/
+    python3 check_motion.py
+Also prints the median ratio of both scores while moving, to rescale the thresholds from.
+Exits with 1 if the events differ, or one is more than MAX_LAG frames late or early.
+"""
+
+"""full resolution (moving, still) thresholds of each detector, before downsampling and averaging"""
+REFERENCE_THRES = {"crosswalk": (40, 9), "truck": (70, 15)}
+"""max number of frames an event can be late or early (the averaging window delays it)"""
+MAX_LAG = 3
+ROWS = Driver.ROWS
+COLS = Driver.COLS
+
+
+def detectors():
+    """Returns:
+        dict: name -> (crop, moving threshold, still threshold) of the motion detectors of the driver
+    """
+    return {
+        "crosswalk": (Driver.CROSSWALK_MOTION_CROP, Driver.CROSSWALK_MSE_MOVING_THRES, Driver.CROSSWALK_MSE_STOPPED_THRES),
+        "truck": (Driver.TRUCK_MOTION_CROP, Driver.TRUCK_MSE_IN_MIN, Driver.TRUCK_MSE_OUT_MAX),
+    }
+
+
+def background(rng):
+    """Returns:
+        cv::Mat: a BGR view of sky, textured grass and road, for the synthetic scenes
+    """
+    img = np.zeros((ROWS, COLS, 3), np.uint8)
+    img[:ROWS//3] = (200, 170, 140)
+    texture = cv2.resize(rng.uniform(0, 60, (24, 40)).astype(np.float32), (COLS, ROWS - ROWS//3), interpolation=cv2.INTER_CUBIC)
+    img[ROWS//3:] = np.clip(np.dstack([50 + texture, 110 + texture, 50 + texture]), 0, 255).astype(np.uint8)
+    img[ROWS//2:, COLS//2 - 200:COLS//2 + 200] = (90, 90, 90)
+    img[ROWS//2 + 40:ROWS//2 + 70] = (0, 0, 230)
+    return img
+
+
+def pedestrian(bg, x):
+    frame = bg.copy()
+    cv2.rectangle(frame, (x, 260), (x + 50, 470), (30, 30, 40), -1)
+    cv2.circle(frame, (x + 25, 235), 25, (150, 170, 200), -1)
+    return frame
+
+
+def truck(bg, x):
+    frame = bg.copy()
+    cv2.rectangle(frame, (x, 250), (x + 420, 460), (30, 30, 200), -1)
+    # panels of the trailer, its whole length moves (not only its ends)
+    for px in range(x + 20, x + 300, 40):
+        cv2.line(frame, (px, 260), (px, 450), (20, 20, 90), 6)
+    cv2.rectangle(frame, (x + 300, 200), (x + 420, 300), (200, 200, 200), -1)
+    return frame
+
+
+def synthetic_scenes(seed=0):
+    """Still views with an object crossing them at different speeds, stopping and leaving.
+
+    Args:
+        seed (int, optional): seed of the background texture. Defaults to 0.
+
+    Returns:
+        list[tuple(str, str, list)]: detector name, scene name, BGR frames
+    """
+    bg = background(np.random.default_rng(seed))
+    scenes = []
+    for speed in (3, 4, 5, 8):
+        # still, crosses half way, stops, crosses back
+        xs = [400] * 10 + [400 + speed * i for i in range(30)] + [400 + speed * 29] * 20
+        xs += [400 + speed * (29 - i) for i in range(30)] + [400] * 20
+        scenes.append(("crosswalk", f"pedestrian {speed} px/frame", [pedestrian(bg, x) for x in xs]))
+    for speed in (6, 10, 20):
+        # still, the truck crosses the whole view, still again
+        xs = list(range(-450, COLS + 50, speed))
+        frames = [bg] * 10 + [truck(bg, x) for x in xs] + [bg] * 20
+        scenes.append(("truck", f"truck {speed} px/frame", frames))
+    return scenes
+
+
+def events(detector, frames):
+    """Feeds the frames to a detector.
+
+    Returns:
+        tuple(list, list): (frame index, MOVING or STILL) of every event, score of every frame
+    """
+    found, scores = [], []
+    for i, frame in enumerate(frames):
+        event = detector.update(frame)
+        if event:
+            found.append((i, event))
+        scores.append(detector.score)
+    return found, scores
+
+
+def check(name, frames, max_lag=MAX_LAG):
+    """Compares the driver's detector to the full resolution reference on a sequence of frames.
+
+    Args:
+        name (str): detector name (see detectors)
+        frames (list[cv::Mat]): BGR frames
+        max_lag (int, optional): max number of frames between matching events. Defaults to MAX_LAG.
+
+    Returns:
+        tuple(bool, list, list, float): True if the events match, reference events, events, median ratio
+            of the scores on the frames the reference sees as moving (nan if none)
+    """
+    crop, moving_thres, still_thres = detectors()[name]
+    reference = MotionDetector(crop, *REFERENCE_THRES[name], step=1, window=1)
+    detector = MotionDetector(crop, moving_thres, still_thres)
+    ref_events, ref_scores = events(reference, frames)
+    found, scores = events(detector, frames)
+    ok = len(ref_events) == len(found) and all(
+        e == f and abs(i - j) <= max_lag for (i, e), (j, f) in zip(ref_events, found))
+    ref_scores, scores = np.array(ref_scores), np.array(scores)
+    moving = ref_scores > REFERENCE_THRES[name][0]
+    ratio = float(np.median(scores[moving] / ref_scores[moving])) if moving.any() else float("nan")
+    return ok, ref_events, found, ratio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the motion detectors of the driver against the full resolution mse.')
+    parser.add_argument('detector', nargs='?', choices=sorted(REFERENCE_THRES), help='detector the frames are for')
+    parser.add_argument('frames', nargs='?', help='recorded BGR frames (see replay.iter_frames). Defaults to synthetic scenes.')
+    parser.add_argument('--max-lag', type=int, default=MAX_LAG)
+    args = parser.parse_args()
+    if bool(args.detector) != bool(args.frames):
+        parser.error("give both the detector and the frames, or neither")
+
+    if args.frames:
+        scenes = [(args.detector, args.frames, list(iter_frames(args.frames)))]
+    else:
+        scenes = synthetic_scenes()
+    failed = False
+    for name, scene, frames in scenes:
+        ok, ref_events, found, ratio = check(name, frames, args.max_lag)
+        print(f"{name}, {scene}: {len(frames)} frames, score ratio {ratio:.2f}, {'match' if ok else 'MISMATCH'}")
+        if not ok:
+            print(f"  full resolution: {ref_events}")
+            print(f"  driver:          {found}")
+        failed = failed or not ok
+    print("FAIL" if failed else "PASS")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#! /usr/bin/env python3
+
+import argparse
+import glob
+import os
+import sys
+import cv2
+import numpy as np
+
+import ros_shim
+ros_shim.install()
+
+from char_reader import CharReader
+from prediction_cache import PredictionCache
+
+"""
+Checks that the prediction cache hits on near identical character crops: the images of each bundled character
+set are cached, then looked up again with +-1 noise added, the way consecutive frames of a plate differ. Also
+checks that no crop (noisy or not) hits the prediction of a different character.
+e.g.:
+    python3 check_prediction_cache.py
+Exits with 1 if the hit rate is too low or a lookup returns the prediction of another character.
+"""
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATA_DIRS = ['alpha-edge-data', 'num-edge-data', 'alpha-data-compressed', 'num-data-compressed', 'char-data']
+"""min share of the noisy crops that should hit the cache, in each set"""
+MIN_HIT_RATE = 0.95
+
+
+def load_crops(folders):
+    """Loads the character images of the folders at the input size of the character model, like
+    CharReader.pre_processing_for_model.
+
+    Args:
+        folders (list[str]): folders of character images, named plate_<character>...
+
+    Returns:
+        tuple(list, list): the grayscale crops, their characters
+    """
+    crops, labels = [], []
+    for folder in folders:
+        for path in sorted(glob.glob(os.path.join(folder, '*.png'))):
+            crops.append(cv2.cvtColor(cv2.resize(cv2.imread(path), CharReader.CHAR_SIZE), cv2.COLOR_BGR2GRAY))
+            labels.append(os.path.basename(path)[len('plate_')])
+    return crops, labels
+
+
+def add_noise(img, rng, amplitude=1):
+    """Returns:
+        cv::Mat: the image with uniform noise of +-amplitude gray levels added to every pixel
+    """
+    noise = rng.integers(-amplitude, amplitude + 1, img.shape)
+    return np.uint8(np.clip(img.astype(np.int32) + noise, 0, 255))
+
+
+def check(crops, labels, seed=0):
+    """Caches a prediction (its character) for every crop, then looks up every crop and a noisy copy of it.
+
+    Args:
+        crops (list[cv::Mat]): grayscale character crops
+        labels (list[str]): character of each crop
+        seed (int, optional): seed of the noise. Defaults to 0.
+
+    Returns:
+        tuple(float, list): share of the noisy crops that hit, indices of the crops that hit another character
+    """
+    cache = PredictionCache(capacity=len(crops))
+    for crop, label in zip(crops, labels):
+        cache.put(cache.keys("check", crop)[0], crop, label)
+    rng = np.random.default_rng(seed)
+    hits = 0
+    wrong = []
+    for i, (crop, label) in enumerate(zip(crops, labels)):
+        noisy = add_noise(crop, rng)
+        pred = cache.get(cache.keys("check", noisy), noisy)
+        hits += pred is not None
+        if any(p is not None and p != label for p in (pred, cache.get(cache.keys("check", crop), crop))):
+            wrong.append(i)
+    return hits / len(crops), wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the prediction cache on noisy character crops.')
+    parser.add_argument('folders', nargs='*', default=[os.path.join(SRC_DIR, d) for d in DATA_DIRS],
+                        help='folders of character images, checked one at a time. Defaults to the bundled character sets.')
+    parser.add_argument('--min-hit-rate', type=float, default=MIN_HIT_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    for folder in args.folders:
+        crops, labels = load_crops([folder])
+        if not crops:
+            print(f"no character images in {folder}")
+            failed = True
+            continue
+        hit_rate, wrong = check(crops, labels, args.seed)
+        print(f"{os.path.basename(os.path.normpath(folder))}: {len(crops)} crops with +-1 noise: hit rate {hit_rate:.3f}, "
+              f"hits on another character {len(wrong)}")
+        for i in wrong:
+            print(f"  crop {i:>6} ({labels[i]}) hit another character")
+        failed = failed or hit_rate < args.min_hit_rate or bool(wrong)
+    print("FAIL" if failed else "PASS")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+
+import argparse
+import os
+import sys
+import numpy as np
+
+import ros_shim
+ros_shim.install()
+
+from replay import iter_frames
+from scrape_frames import DataScraper
+
+"""
+Checks that the downscale-first preprocessing (DataScraper.process_img(img, downscale_first=True)) gives
+the same masks as the pipeline the drive models were trained on, within a tolerance, on recorded frames.
+e.g.:
+    python3 check_preprocessing.py ~/lap-frames/
+Exits with 1 if a frame is out of tolerance, so it should be run before enabling Driver.PREPROCESS_DOWNSCALE_FIRST.
+"""
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+"""max fraction of the pixels of a mask allowed to differ"""
+MAX_MISMATCH = 0.02
+"""min intersection over union of the white pixels of both masks (when the mask has white pixels)"""
+MIN_IOU = 0.9
+
+
+def compare_masks(reference, candidate):
+    """Compares two binary masks of the same size.
+
+    Args:
+        reference (cv::Mat): mask from the current pipeline
+        candidate (cv::Mat): mask from the downscale-first pipeline
+
+    Returns:
+        tuple(float, float): fraction of pixels differing, intersection over union of the white pixels
+            (1 if both masks are empty)
+    """
+    if reference.shape != candidate.shape:
+        raise ValueError(f"Mask shapes differ: {reference.shape} != {candidate.shape}")
+    ref = reference > 0
+    cand = candidate > 0
+    mismatch = np.count_nonzero(ref != cand) / ref.size
+    union = np.count_nonzero(ref | cand)
+    iou = np.count_nonzero(ref & cand) / union if union else 1.0
+    return mismatch, iou
+
+
+def check(frames, max_mismatch=MAX_MISMATCH, min_iou=MIN_IOU):
+    """Compares both pipelines on every frame.
+
+    Args:
+        frames (iterable of cv::Mat): BGR frames
+        max_mismatch (float, optional): max fraction of differing pixels. Defaults to MAX_MISMATCH.
+        min_iou (float, optional): min intersection over union of the white pixels. Defaults to MIN_IOU.
+
+    Returns:
+        tuple(list, list): (mismatch, iou) of every frame, indices of the frames out of tolerance
+    """
+    results = []
+    failed = []
+    for i, frame in enumerate(frames):
+        mismatch, iou = compare_masks(DataScraper.process_img(frame), DataScraper.process_img(frame, downscale_first=True))
+        results.append((mismatch, iou))
+        if mismatch > max_mismatch or iou < min_iou:
+            failed.append(i)
+    return results, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the downscale-first preprocessing against the current pipeline.')
+    parser.add_argument('frames', nargs='?', default=os.path.join(SRC_DIR, 'license-plate-data'),
+                        help='folder or archive of recorded BGR frames (see replay.py). Defaults to the bundled plate frames.')
+    parser.add_argument('--max-mismatch', type=float, default=MAX_MISMATCH)
+    parser.add_argument('--min-iou', type=float, default=MIN_IOU)
+    args = parser.parse_args()
+
+    results, failed = check(iter_frames(args.frames), args.max_mismatch, args.min_iou)
+    if not results:
+        print(f"no frames in {args.frames}")
+        sys.exit(1)
+    mismatches, ious = np.array(results).T
+    print(f"{len(results)} frames: mismatch mean {mismatches.mean():.4f} max {mismatches.max():.4f}, "
+          f"iou mean {ious.mean():.3f} min {ious.min():.3f}")
+    for i in failed:
+        print(f"  frame {i:>6} out of tolerance: mismatch {mismatches[i]:.4f}, iou {ious[i]:.3f}")
+    print("FAIL" if failed else "PASS")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
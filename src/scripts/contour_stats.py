@@ -0,0 +1,110 @@
+#! /usr/bin/env python3
+
+import cv2
+import numpy as np
+
+"""
+Contour statistics of binary masks, shared by the blue slow-down check, the red line check and the plate
+detection. Only the outer contours are retrieved, with compressed chains (the areas are the same as with
+the full chains), and the largest k are selected in O(n) instead of sorting every contour.
+"""
+
+
+class ContourStats:
+    """This class holds the largest contours of a binary mask, with their areas and bounding boxes, largest first.
+    """
+
+    def __init__(self, contours, areas, boxes):
+        """Creates a ContourStats object.
+
+        Args:
+            contours (list[ndarray]): the contours, largest first
+            areas (ndarray): area of each contour
+            boxes (ndarray): bounding box (x, y, w, h) of each contour, shape (k, 4)
+        """
+        self.contours = contours
+        self.areas = areas
+        self.boxes = boxes
+
+    def __len__(self):
+        return len(self.contours)
+
+    def __bool__(self):
+        return len(self.contours) > 0
+
+    @property
+    def largest(self):
+        """Returns:
+            ndarray: the largest contour, None if there is none
+        """
+        return self.contours[0] if self.contours else None
+
+    @property
+    def largest_area(self):
+        """Returns:
+            float: area of the largest contour, 0 if there is none
+        """
+        return float(self.areas[0]) if self.contours else 0.0
+
+    def centroid(self, i=0):
+        """Center of mass of a contour.
+
+        Args:
+            i (int, optional): rank of the contour. Defaults to 0 (the largest).
+
+        Returns:
+            tuple(int, int): cx, cy, or None if the contour has no area
+        """
+        M = cv2.moments(self.contours[i])
+        if not M['m00']:
+            return None
+        return int(M['m10']/M['m00']), int(M['m01']/M['m00'])
+
+
+def top_k_indices(values, k):
+    """Indices of the k largest values, largest first, selected in O(n) (only those k are sorted).
+
+    Args:
+        values (ndarray): 1D array
+        k (int): number of indices
+
+    Returns:
+        ndarray: the indices
+    """
+    if k >= len(values):
+        return np.argsort(values)[::-1]
+    top = np.argpartition(values, -k)[-k:]
+    return top[np.argsort(values[top])[::-1]]
+
+
+def top_contours(mask, k=1):
+    """Obtains the k largest outer contours of a binary mask.
+
+    Args:
+        mask (cv::Mat): Binary image (i.e. two values)
+        k (int, optional): number of contours to keep. Defaults to 1 (the largest).
+
+    Returns:
+        ContourStats: the largest contours, their areas and bounding boxes, largest first
+    """
+    contours, hierarchy = cv2.findContours(image=mask, mode=cv2.RETR_EXTERNAL, method=cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return ContourStats([], np.zeros(0), np.zeros((0, 4), dtype=int))
+    areas = np.fromiter((cv2.contourArea(c) for c in contours), dtype=float, count=len(contours))
+    top = top_k_indices(areas, k)
+    kept = [contours[i] for i in top]
+    boxes = np.array([cv2.boundingRect(c) for c in kept], dtype=int)
+    return ContourStats(kept, areas[top], boxes)
+
+
+def top_areas(mask, k=1):
+    """Obtains the top contour areas of a binary mask.
+
+    Args:
+        mask (cv::Mat): Binary image (i.e. two values)
+        k (int, optional): number of top contour areas to obtain. Defaults to 1 (the max).
+
+    Returns:
+        list(float): the top contour areas, sorted in descending order
+    """
+    return top_contours(mask, k).areas.tolist()
@@ -0,0 +1,203 @@
+#! /usr/bin/env python3
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext
+from hsv_view import ImageProcessor
+
+"""
+Red line (crosswalk) detection, cheap enough to run on every driving frame: only the lower band of
+the frame, where a close red line can appear, is looked at (subsampled), and the red pixels are counted
+per row instead of searching for contours.
+"""
+
+ROWS = 720
+
+
+def runs(indices, max_gap=1):
+    """Runs of nearly consecutive indices, e.g. the rows of each line seen.
+
+    Args:
+        indices (ndarray): sorted indices, not empty
+        max_gap (int, optional): max difference between two indices of the same run. Defaults to 1.
+
+    Returns:
+        list[tuple(int, int)]: first and last index of each run, in order
+    """
+    gaps = np.flatnonzero(np.diff(indices) > max_gap)
+    firsts = np.concatenate(([indices[0]], indices[gaps + 1]))
+    lasts = np.concatenate((indices[gaps], [indices[-1]]))
+    return [(int(first), int(last)) for first, last in zip(firsts, lasts)]
+
+
+def nearest_run(indices, max_gap=1):
+    """Last run of nearly consecutive indices, e.g. the rows of the nearest line.
+
+    Args:
+        indices (ndarray): sorted indices, not empty
+        max_gap (int, optional): max difference between two indices of the same run. Defaults to 1.
+
+    Returns:
+        tuple(int, int): first and last index of the run
+    """
+    return runs(indices, max_gap)[-1]
+
+
+def heaviest_run(counts, max_gap=1):
+    """Run of nearly consecutive non zero counts with the largest total, e.g. the rows of the line with the
+    most red pixels (a few stray pixels never outweigh a line).
+
+    Args:
+        counts (ndarray): count per index (e.g. red pixels per row), with at least one non zero count
+        max_gap (int, optional): max difference between two indices of the same run. Defaults to 1.
+
+    Returns:
+        tuple(int, int, int): first and last index of the run, total of its counts
+    """
+    cumsum = np.concatenate(([0], np.cumsum(counts)))
+    totals = [(int(cumsum[last + 1] - cumsum[first]), first, last) for first, last in runs(np.flatnonzero(counts), max_gap)]
+    total, first, last = max(totals)
+    return first, last, total
+
+
+class RedLine:
+    """This class holds the result of looking for the red line in one frame.
+    """
+
+    def __init__(self, close=False, area=0, row=-1, distance=-1):
+        """Creates a RedLine object.
+
+        Args:
+            close (bool): True if the red line is close enough to stop
+            area (int): estimated area of the line (in full resolution pixels), from its red pixels
+            row (float): row of the center of the line in the frame, -1 if no line
+            distance (int): distance of the near edge of the line to the bottom of the frame in pixels, -1 if no line
+        """
+        self.close = close
+        self.area = area
+        self.row = row
+        self.distance = distance
+
+    def __bool__(self):
+        return self.close
+
+
+class RedLineDetector:
+    """This class detects the red line in front of the robot from the red pixels of the lower band of the frame.
+
+    The line is the run of rows of the row projection with the most red pixels, so that neither the other
+    stripes of the crosswalk nor stray red pixels (below or above the line) are counted or mistaken for it.
+    Its red pixels are compared to the area threshold, like the area of the largest contour was (with the pixel
+    of blur around the line the contours of ImageProcessor.filter included).
+    """
+
+    def __init__(self, area_thres, row_start=ROWS//2, step=2, line_frac=0.5):
+        """Creates a RedLineDetector object.
+
+        Args:
+            area_thres (int): min number of red pixels of the line (in full resolution pixels) for it to be close
+            row_start (int, optional): first row of the band looked at. Defaults to ROWS//2.
+            step (int, optional): keep one pixel out of step, in both directions. Defaults to 2.
+            line_frac (float, optional): rows with at least this fraction of the red pixels of the fullest row
+                are part of the line fitted by fit_line. Defaults to 0.5.
+        """
+        self.area_thres = area_thres
+        self.row_start = row_start
+        self.step = step
+        self.line_frac = line_frac
+        self.low = np.array(ImageProcessor.red_low, dtype=np.uint8)
+        self.up = np.array(ImageProcessor.red_up, dtype=np.uint8)
+
+    def detect(self, img):
+        """Looks for the red line in a frame.
+
+        Args:
+            img (cv::Mat or FrameContext): raw image data
+
+        Returns:
+            RedLine: whether the line is close, its area, row and distance
+        """
+        frame = FrameContext.of(img)
+        hsv = frame.hsv_rows(self.row_start, self.step)
+        mask = cv2.inRange(hsv, self.low, self.up)
+        # red pixels per row
+        rows = cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+        if not rows.any():
+            return RedLine()
+        first, last, count = heaviest_run(rows)
+        pixels = count * self.step * self.step
+        # the threshold was tuned on the contour of the blurred mask (ImageProcessor.filter), which
+        # reaches about one pixel further around the line: (height + 1) * (width + 1) for a band
+        height = (last - first + 1) * self.step
+        area = int(round((height + 1) * (pixels / height + 1)))
+        line_rows = np.arange(first, last + 1)
+        row = self.row_start + float(np.average(line_rows, weights=rows[line_rows])) * self.step
+        bottom = self.row_start + last * self.step
+        rows_total = frame.img.shape[0]
+        return RedLine(area > self.area_thres, area, row, rows_total - 1 - bottom)
+
+    def fit_line(self, img, row_start=ROWS//3):
+        """Fits a straight line to the pixels of the nearest red line (the lowest band of rows with red pixels),
+        e.g. to align the robot with it.
+        The angle, offset and confidence all come from one least-squares fit of the center of the red pixels
+        of each column of the band.
+
+        Args:
+            img (cv::Mat or FrameContext): raw image data
+            row_start (int, optional): first row of the band looked at. Defaults to ROWS//3.
+
+        Returns:
+            LineFit: angle, offset and confidence of the line, with a confidence of 0 if there is no line
+        """
+        frame = FrameContext.of(img)
+        step = self.step
+        mask = cv2.inRange(frame.hsv_rows(row_start, step), self.low, self.up)
+        rows = cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+        if not rows.any():
+            return LineFit()
+        line_rows = np.flatnonzero(rows >= self.line_frac * rows.max())
+        # the runs of consecutive line rows are the lines seen, the last one is the nearest
+        first, last = nearest_run(line_rows, 2)
+        margin = max(2, (last - first) // 2)
+        band_start = max(0, first - margin)
+        # one point per column: the center of its red pixels in the band
+        band = mask[band_start:last + margin + 1] // 255
+        counts = band.sum(axis=0)
+        xs = np.flatnonzero(counts)
+        if len(xs) < 2:
+            return LineFit()
+        ys = np.arange(band.shape[0], dtype=np.float32) @ band[:, xs] / counts[xs]
+        pts = np.column_stack((xs, ys + band_start)).astype(np.float32) * step
+        pts[:, 1] += row_start
+        vx, vy, x0, y0 = cv2.fitLine(pts, cv2.DIST_HUBER, 0, 0.01, 0.01).ravel()
+        if abs(vx) < 1e-6:
+            return LineFit()
+        angle = float(np.rad2deg(np.arctan(vy / vx)))
+        # share of the columns centered within the half thickness of the band, over the share of the width covered
+        dist = np.abs((pts[:, 0] - x0) * vy - (pts[:, 1] - y0) * vx)
+        inliers = np.count_nonzero(dist <= (last + margin - first + 1) * step / 2.0) / len(pts)
+        coverage = (pts[:, 0].max() - pts[:, 0].min() + step) / frame.img.shape[1]
+        # row of the fitted line at the center column of the frame
+        offset = y0 + (frame.img.shape[1] / 2.0 - x0) * vy / vx
+        return LineFit(angle, float(offset), float(min(1.0, coverage) * inliers))
+
+
+class LineFit:
+    """This class holds the straight line fitted to the red line in one frame.
+    """
+
+    def __init__(self, angle=0.0, offset=-1.0, confidence=0.0):
+        """Creates a LineFit object.
+
+        Args:
+            angle (float): angle of the line to the horizontal in degrees, positive when its right end is lower
+            offset (float): row of the center of the line at the center column of the frame, -1 if no line
+            confidence (float): from 0 (no line) to 1 (a straight line across the whole frame)
+        """
+        self.angle = angle
+        self.offset = offset
+        self.confidence = confidence
+
+    def __bool__(self):
+        return self.confidence > 0
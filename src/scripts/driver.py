@@ -1,3 +1,4 @@
+from startup import STARTUP, load_parallel
 from geometry_msgs.msg import Twist
 import rospy
 import cv2
@@ -10,15 +11,31 @@ from time import sleep
 from hsv_view import ImageProcessor
 from model import Model
 from scrape_frames import DataScraper
-from plate_reader import PlateReader
-from pull_plate import PlatePull
+from frame_context import FrameContext
+from frame_mailbox import FrameMailbox
+from plate_worker import RecognitionWorker
+from latency import LATENCY
+from plate_reader import PlateReader, READER_BACKEND
+from contour_stats import top_areas, top_contours
+from crosswalk import RedLineDetector
+from gating import GATES
+from prediction_cache import PREDICTION_CACHE
+from plate_pass import PlatePassBuffer
+from motion import MotionDetector, MOVING, STILL
+from inference import import_backend
+import threading
 import time
 from std_msgs.msg import String
 
+STARTUP.mark("imports")
+
 class Driver:
     DEF_VALS = (0.5, 0.5)
     MODEL_PATH = "/home/fizzer/ros_ws/src/models/drive_model-0.h5"
     INNER_MOD_PATH = "/home/fizzer/ros_ws/src/models/inner-drive_model-5.h5"
+    MODEL_BACKEND = "fast"
+    """crop the frame before filtering and compressing it, instead of using the white mask of the whole frame (see check_preprocessing.py)"""
+    PREPROCESS_DOWNSCALE_FIRST = False
     """
     (0.5,0) = 0
     (0, -1) = 1
@@ -34,13 +51,26 @@ class Driver:
         4 : (DataScraper.SET_X, DataScraper.SET_Z)
     }
     FPS = 20
+    """frame ingestion"""
+    CAMERA_BUFF_SIZE = 2**24
+    FRAME_REPORT_SECS = 10
+    RECOGNITION_QUEUE_SIZE = 2
+    """plates are read once per pass past them, from the best views of the pass"""
+    DEFER_RECOGNITION = True
+    PLATE_PASS_CAPACITY = 64
+    PLATE_PASS_BEST_K = 8
+    """latency instrumentation"""
+    LATENCY_PUBLISH_SECS = 5
+    LATENCY_CSV_PATH = "/tmp/driver_latency.csv"
     ROWS = 720
     COLS = 1280
     """crosswalk"""
     CROSSWALK_FRONT_AREA_THRES = 5000-1500
     CROSSWALK_BACK_AREA_THRES = 400
-    CROSSWALK_MSE_STOPPED_THRES = 9
-    CROSSWALK_MSE_MOVING_THRES = 40
+    """region of the view the pedestrian crosses, and its motion thresholds (see MotionDetector, check_motion.py)"""
+    CROSSWALK_MOTION_CROP = (180, ROWS-180, 320, COLS-320)
+    CROSSWALK_MSE_STOPPED_THRES = 5
+    CROSSWALK_MSE_MOVING_THRES = 30
     DRIVE_PAST_CROSSWALK_FRAMES = int(FPS*3)
     FIRST_STOP_SECS = 1
     CROSSWALK_X = 0.4
@@ -58,8 +88,10 @@ class Driver:
     MIN_INNER_ID_FREQ = 3
     """transition"""
     STRAIGHT_DEGS_THRES = 0.3
+    """row of the center of the red line at the center column of the frame when aligned (see RedLineDetector.fit_line)"""
     RED_INTERSEC_PIX = 445
     RED_INTERSEC_PIX_THRES = 5
+    MIN_LINE_CONFIDENCE = 0.3
 
     """Outside loop control"""
     NUM_CROSSWALK_STOP = 4
@@ -69,35 +101,66 @@ class Driver:
     """Turn to inside intersec"""
     BLUE_AREA_THRES_TURN = 10000
 
-    TRUCK_MSE_IN_MIN = 70
-    TRUCK_MSE_OUT_MAX = 15 
+    """region of the view the truck crosses, and its motion thresholds (see MotionDetector, check_motion.py)"""
+    TRUCK_MOTION_CROP = (int(ROWS/3), int(2*ROWS/3), int(COLS/2.65), int(2*COLS/2.65))
+    TRUCK_MSE_IN_MIN = 52
+    TRUCK_MSE_OUT_MAX = 9
     TRUCK_STOP_SECS = 0.5
 
     INNER_X = 0.5
+    """debug windows"""
+    SHOW_DEBUG = True
 
-    def __init__(self):
+    def __init__(self, live=True, clock=time.time, twist_pub=None, license_pub=None):
         """Creates a Driver object. Responsible for driving the robot throughout the track. 
+
+        Args:
+            live (bool, optional): True to run on the camera topic, with the control loop and the plate recognition
+                on their own threads. False to be fed frames through process_frame by the caller, everything running
+                on the caller's thread (e.g. replay.py). Defaulted to True.
+            clock (callable, optional): returns the current time in seconds. Defaulted to time.time.
+            twist_pub (rospy.Publisher, optional): publisher of the velocities. Defaulted to the /R1/cmd_vel publisher.
+            license_pub (rospy.Publisher, optional): publisher of the plates. Defaulted to the /license_plate publisher.
         """            
-        self.twist_pub = rospy.Publisher('/R1/cmd_vel', Twist, queue_size=1)
-        self.image_sub = rospy.Subscriber("/R1/pi_camera/image_raw", Image, self.callback_img)
-        self.license_pub = rospy.Publisher("/license_plate", String, queue_size=1)
+        self.live = live
+        self.clock = clock
+        if twist_pub is None:
+            twist_pub = rospy.Publisher('/R1/cmd_vel', Twist, queue_size=1)
+        if license_pub is None:
+            license_pub = rospy.Publisher("/license_plate", String, queue_size=1)
+        self.twist_pub = twist_pub
+        self.license_pub = license_pub
         self.move = Twist()
         self.bridge = CvBridge()
 
         self.move.linear.x = 0
         self.move.angular.z = 0
 
-        self.dv_mod = Model(Driver.MODEL_PATH)
-        self.inner_dv_mod = Model(Driver.INNER_MOD_PATH)
-        self.pr = PlateReader(script_run=False)
+        STARTUP.mark("publishers")
+        with STARTUP.phase("import inference backends"):
+            import_backend(Driver.MODEL_BACKEND)
+            import_backend(READER_BACKEND)
+        # all five models are loaded concurrently and warmed up
+        loaders = PlateReader.reader_loaders()
+        loaders["drive"] = lambda: Model(Driver.MODEL_PATH, Driver.MODEL_BACKEND)
+        loaders["inner drive"] = lambda: Model(Driver.INNER_MOD_PATH, Driver.MODEL_BACKEND)
+        with STARTUP.phase("all models (wall time)"):
+            loaded = load_parallel(loaders)
+        self.dv_mod = loaded["drive"]
+        self.inner_dv_mod = loaded["inner drive"]
+        self.pr = PlateReader(script_run=False, readers=loaded)
         """crosswalk"""
         self.is_stopped_crosswalk = False
         self.first_ped_moved = False
         self.first_ped_stopped = False
-        self.prev_mse_frame = None
+        self.crosswalk_motion = MotionDetector(Driver.CROSSWALK_MOTION_CROP, 
+            Driver.CROSSWALK_MSE_MOVING_THRES, Driver.CROSSWALK_MSE_STOPPED_THRES)
         self.crossing_crosswalk_count = 0
         self.is_crossing_crosswalk = False
         self.first_stopped_frames_count = 0
+        self.red_line_detector = RedLineDetector(Driver.CROSSWALK_FRONT_AREA_THRES)
+        self.red_line = None
+        self.red_line_fit = None
 
         """license plate model acquisition control"""
         self.at_plate = False
@@ -110,11 +173,18 @@ class Driver:
         self.lp_dict = {}
         self.id_dict = {}
         self.id_stats_dict = {}
+        # track ID (one physical plate) -> {(id, license plate): freq}
+        self.track_dict = {}
+        # plate recognition runs in the background, the predictions are updated from its thread
+        self.preds_lock = threading.Lock()
+        self.recognizer = RecognitionWorker(self.recognize_plate, Driver.RECOGNITION_QUEUE_SIZE, num_threads=1 if live else 0)
+        self.plate_pass = PlatePassBuffer(Driver.PLATE_PASS_CAPACITY)
+        self.was_acquiring_lp = False
 
         """Loop control"""
         self.num_crosswalks = 0
         self.first_crosswalk_stop = True
-        self.start = time.time()
+        self.start = self.clock()
         self.curr_t = self.start
         self.outside_ended = False
         self.acquire_lp = False
@@ -136,23 +206,112 @@ class Driver:
         self.was_truck_out = False
         self.truck_test_complete = False
         self.truck_frames_count = 0
-        self.prev_mse_truck = None
+        self.truck_motion = MotionDetector(Driver.TRUCK_MOTION_CROP, 
+            Driver.TRUCK_MSE_IN_MIN, Driver.TRUCK_MSE_OUT_MAX)
 
         self.end_state = False
         self.results = {}
         self.id_int = 0
 
+        self.mailbox = FrameMailbox()
+        if live:
+            # only subscribe once everything is loaded, the first frame is handled at steady-state latency.
+            # the subscriber only keeps the newest frame, processed by a worker thread
+            self.image_sub = rospy.Subscriber("/R1/pi_camera/image_raw", Image, self.mailbox.put, 
+                queue_size=1, buff_size=Driver.CAMERA_BUFF_SIZE)
+            self.frame_worker = threading.Thread(target=self.process_frames, daemon=True)
+            self.frame_worker.start()
+            # per-stage latency percentiles, published periodically and dumped at shutdown
+            self.latency_pub = rospy.Publisher("/driver/latency", String, queue_size=1)
+            self.latency_timer = rospy.Timer(rospy.Duration(Driver.LATENCY_PUBLISH_SECS), 
+                lambda event: self.latency_pub.publish(String(LATENCY.to_json())))
+            rospy.on_shutdown(lambda: LATENCY.to_csv(Driver.LATENCY_CSV_PATH))
+        STARTUP.mark("state")
+        STARTUP.report()
+
+    def process_frames(self):
+        """Control loop, running at Driver.FPS until shutdown: processes the newest camera frame from the mailbox
+        with callback_img. Plate recognition is handed off to the recognition worker, so the control loop's 
+        latency does not depend on it.
+        Periodically prints the number of dropped frames and the frame age at processing time.
+        An error processing a frame is printed and the loop goes on with the next frame.
+        """
+        rate = rospy.Rate(Driver.FPS)
+        last_report = time.monotonic()
+        while not rospy.is_shutdown():
+            data, age = self.mailbox.take(timeout=1.0/Driver.FPS)
+            if data is not None:
+                LATENCY.state = self.state_name()
+                try:
+                    with LATENCY.stage("frame"):
+                        self.callback_img(data)
+                except Exception as e:
+                    # as rospy does for a subscriber callback: the error is logged and the next frame processed
+                    print("frame failed:", e)
+            if time.monotonic() - last_report > Driver.FRAME_REPORT_SECS:
+                print(self.mailbox.report())
+                print(self.recognizer.report())
+                print(self.pr.tracker.report())
+                print(GATES.report())
+                print(PREDICTION_CACHE.report())
+                print(self.plate_pass.report())
+                last_report = time.monotonic()
+            try:
+                rate.sleep()
+            except rospy.ROSInterruptException:
+                break
+        self.mailbox.close()
+        self.recognizer.close()
+
+    def state_name(self):
+        """Name of the state the robot is currently in, the latency samples are recorded under it.
+
+        Returns:
+            str: the state name
+        """
+        if self.end_state:
+            return "end"
+        if self.start_seq_state:
+            return "start"
+        if self.publish_state_inner:
+            return "publish inner"
+        if self.start_inner_loop:
+            return "start inner"
+        if self.inner_loop:
+            return "inner loop"
+        if self.turning_transition:
+            return "turning transition"
+        if self.in_transition:
+            return "transition"
+        if self.update_preds_state and self.outside_ended:
+            return "update predictions"
+        if self.is_stopped_crosswalk:
+            return "stopped crosswalk"
+        if self.is_crossing_crosswalk:
+            return "crossing crosswalk"
+        return "outside loop"
+
     def callback_img(self, data):
         """Callback function for the subscriber node for the /image_raw ros topic. 
         This callback is called when a new message has arrived to the /image_raw topic (i.e. a new frame from the camera).
-        Using the image, it conducts the following:
+        Converts the image and processes it (see process_frame).
+
+        Args:
+            data (sensor_msgs::Image): The image recieved from the robot's camera
+        """
+        with LATENCY.stage("bridge"):
+            cv_image = self.bridge.imgmsg_to_cv2(data, "bgr8")
+        self.process_frame(cv_image)
+
+    def process_frame(self, cv_image):
+        """Processes one frame from the camera. Using the image, it conducts the following:
 
         1) drives and looks for a red line (if not crossing the crosswalk)
         2) if a red line is seen, stops the robot
         3) drives past the red line when pedestrian is not crossing
         
         Args:
-            data (sensor_msgs::Image): The image recieved from the robot's camera
+            cv_image (cv::Mat): The BGR image recieved from the robot's camera
         """
         if self.end_state:
             output_publish = String('TeamYoonifer,multi21,-1,AA00')
@@ -161,7 +320,7 @@ class Driver:
         if self.start_seq_state:
             self.start_seq()
             return
-        cv_image = self.bridge.imgmsg_to_cv2(data, "bgr8")
+        frame = FrameContext(cv_image)
         if self.publish_state_inner:
             if self.id_int < 9:
                 self.get_plate_results2(self.id_int, inner=True)
@@ -177,7 +336,7 @@ class Driver:
             # Facing the inner loop, executes the inner loop sequence by driving in and merging, only when the truck has been past
             # STATE CHANGE: start inner loop --> inner loop
             if not self.truck_test_complete:
-                if self.can_enter_inner(cv_image):
+                if self.can_enter_inner(frame):
                     self.truck_test_complete = True
                 return
             self.inner_loop_seq()
@@ -185,17 +344,21 @@ class Driver:
                 self.inner_loop = True
             return
         if self.inner_loop:
-            self.predict_zone(cv_image, inner=True)
-            self.predict_if_in_zone(cv_image, inner=True)
+            self.predict_zone(frame, inner=True)
+            self.predict_if_in_zone(frame, inner=True)
 
             self.twist_pub.publish(self.move)
-            if '7' in self.id_dict and '8' in self.id_dict and Driver.MIN_INNER_ID_FREQ < self.id_stats_dict['7'][0] and Driver.MIN_INNER_ID_FREQ < self.id_stats_dict['8'][0]:
-                # at least several good ID readings for both
-                self.inner_loop = False
-                self.publish_state_inner = True
-            if (time.time() - self.start) > Driver.END_SECS:
+            with self.preds_lock:
+                if '7' in self.id_dict and '8' in self.id_dict and Driver.MIN_INNER_ID_FREQ < self.id_stats_dict['7'][0] and Driver.MIN_INNER_ID_FREQ < self.id_stats_dict['8'][0]:
+                    # at least several good ID readings for both
+                    self.inner_loop = False
+                    self.publish_state_inner = True
+            if (self.clock() - self.start) > Driver.END_SECS:
                 self.inner_loop = False
                 self.publish_state_inner = True
+            if self.publish_state_inner:
+                # the results are computed from the predictions, let the recognition in progress finish
+                self.finish_recognition(inner=True)
             return
         elif self.turning_transition:
             # At the intersection, turns left to face the inner loop.
@@ -206,7 +369,7 @@ class Driver:
             # Only to be ran when outside predictions updated (stopped at crosswalk and ended outside). Gets the license plate ID and combo results to be published.
             # Straightens the robot to the red line, then backs up beside a crosswalk.
             # STATE CHANGE: in transition --> turning transition (turning to face inner loop)
-            z_st, x_st = self.is_straightened(cv_image)
+            z_st, x_st = self.is_straightened(frame)
             z = 0
             x = 0
             z = -1.0*z_st / 10
@@ -238,7 +401,7 @@ class Driver:
                 self.in_transition = True
                 self.update_preds_state = False
             return
-        self.curr_t = time.time()
+        self.curr_t = self.clock()
         if (self.curr_t - self.start) > Driver.OUTSIDE_LOOP_SECS and self.num_crosswalks >= Driver.NUM_CROSSWALK_STOP and self.is_stopped_crosswalk:
             # Stops the robot and considered outside loop run has ended when: past the set time, visited a number of crosswalks, and currently stopped at a crosswalk. 
             # STATE CHANGE: outside loop --> update predictions
@@ -247,6 +410,8 @@ class Driver:
             self.move.linear.x = 0
             self.move.linear.z = 0
             self.twist_pub.publish(self.move)
+            # the results are computed from the predictions, let the recognition in progress finish
+            self.finish_recognition(inner=False)
             return 
         if self.is_stopped_crosswalk:
             # robot stopped at the crosswalk. only not stopped when it can cross
@@ -255,17 +420,17 @@ class Driver:
                 self.num_crosswalks += 1
                 self.first_crosswalk_stop = False
             print("stopped crosswalk")
-            if self.can_cross_crosswalk(cv_image):
+            if self.can_cross_crosswalk(frame):
                 print("can cross")
                 self.is_stopped_crosswalk = False
-                self.prev_mse_frame = None
+                self.crosswalk_motion.reset()
                 self.first_ped_stopped = False
                 self.first_ped_moved = False
                 self.is_crossing_crosswalk = True
                 self.first_crosswalk_stop = True
                 # self.num_crosswalks += 1
             return
-        self.predict_zone(cv_image, inner=False)
+        self.predict_zone(frame, inner=False)
         if self.is_crossing_crosswalk:
             # crossing the crosswalk. does not look for the red line at this period and drives faster.
             self.crossing_crosswalk_count += 1
@@ -276,7 +441,7 @@ class Driver:
             self.move.linear.x = x
             self.is_crossing_crosswalk = self.crossing_crosswalk_count < Driver.DRIVE_PAST_CROSSWALK_FRAMES  
             # print("crossing")
-        if not self.is_crossing_crosswalk and self.is_red_line_close(cv_image):
+        if not self.is_crossing_crosswalk and self.is_red_line_close(frame):
             # check if red line close only when not crossing
             self.crossing_crosswalk_count = 0 
             print("checking for red line")
@@ -284,7 +449,7 @@ class Driver:
             self.move.angular.z = 0.0
             self.is_stopped_crosswalk = True
             self.first_stopped_frame = True
-        self.predict_if_in_zone(cv_image)
+        self.predict_if_in_zone(frame)
         try:
             self.twist_pub.publish(self.move)
             pass
@@ -296,16 +461,22 @@ class Driver:
         and allows predictions to be valid.
 
         Args:
-            cv_image (cv::Mat): Raw image data from gazebo.
+            cv_image (cv::Mat or FrameContext): Raw image data from gazebo.
             inner (bool, optional): True if called when in the inner loop. Defaulted to False.
         """        
-        hsv = DataScraper.process_img(cv_image, type="bgr")
+        frame = FrameContext.of(cv_image)
+        with LATENCY.stage("process_img"):
+            if Driver.PREPROCESS_DOWNSCALE_FIRST:
+                hsv = DataScraper.process_img(frame.img, downscale_first=True)
+            else:
+                hsv = DataScraper.process_mask(frame.mask("white"))
         
         predicted = None
-        if inner:
-            predicted = self.inner_dv_mod.predict(hsv)
-        else:
-            predicted = self.dv_mod.predict(hsv)
+        with LATENCY.stage("drive inference"):
+            if inner:
+                predicted = self.inner_dv_mod.predict(hsv)
+            else:
+                predicted = self.dv_mod.predict(hsv)
 
         pred_ind = np.argmax(predicted)
         self.move.linear.x = Driver.ONE_HOT[pred_ind][0]
@@ -317,8 +488,8 @@ class Driver:
                 self.move.linear.x = -1*Driver.INNER_X
             
         r_st = int(Driver.ROWS/2.5)
-        crped = ImageProcessor.crop(cv_image, row_start=r_st)
-        blu_area = PlatePull.get_contours_area(ImageProcessor.filter(crped, ImageProcessor.blue_low, ImageProcessor.blue_up))
+        with LATENCY.stage("blue contours"):
+            blu_area = top_areas(frame.mask("blue", row_start=r_st))
 
         if blu_area and blu_area[0] > Driver.SLOW_DOWN_AREA_LOWER and blu_area[0] < Driver.SLOW_DOWN_AREA_UPPER or self.num_fast_frames < Driver.SLOW_DOWN_AREA_FRAMES:
             # Assumes close to a license plate, slows down and allows the prediction to be considered
@@ -349,56 +520,105 @@ class Driver:
 
     def predict_if_in_zone(self, cv_image, inner=False):
         """Updates the license plate ID and char predictions that were made by the model, only if 
-        in a state to do so (i.e. predictions close to the LP)
+        in a state to do so (i.e. predictions close to the LP). 
+        The plate is read in the background by the recognition worker (see recognize_plate); the frame is
+        dropped if the worker is still busy with previous frames.
+        First stage of the gating cascade: only the frames close to a plate (blue area, see predict_zone) are read.
+        With DEFER_RECOGNITION, the views are only collected while close to the plate, and read when the pass ends.
 
         Args:
-            cv_image (cv::Mat): Raw image data from gazebo.
+            cv_image (cv::Mat or FrameContext): Raw image data from gazebo.
             inner (bool, optional): True if called when in the inner loop. Defaulted to False.
         """        
-        pred_id, pred_id_vec = self.pr.prediction_data_id(cv_image)
-        if pred_id:
-            pred_lp, pred_lp_vecs = self.pr.prediction_data_license(cv_image)
-            if pred_lp and self.acquire_lp:
-                # only update predictions if there has been a prediction and when slowed down 
-                self.update_predictions(pred_id, pred_id_vec, pred_lp, pred_lp_vecs, inner)
+        if GATES.check("blue area", self.acquire_lp):
+            self.recognizer.submit(cv_image, self.acquire_lp, inner)
+        elif self.was_acquiring_lp and Driver.DEFER_RECOGNITION:
+            # the pass past the plate ended, its best views are read in the background
+            self.recognizer.submit_call(self.read_plate_pass, inner)
+        self.was_acquiring_lp = self.acquire_lp
+
+    def recognize_plate(self, cv_image, acquire_lp, inner=False):
+        """Reads the plate in a frame and updates the predictions. Runs on the recognition worker's thread.
+
+        Args:
+            cv_image (cv::Mat or FrameContext): Raw image data from gazebo.
+            acquire_lp (bool): True if the robot was in a state to acquire plates when the frame was processed.
+            inner (bool, optional): True if called when in the inner loop. Defaulted to False.
+        """
+        if Driver.DEFER_RECOGNITION:
+            # only collected, read at the end of the pass (see read_plate_pass)
+            frame = FrameContext.of(cv_image)
+            for track_id, quad, score in self.pr.locate_plates(frame):
+                id_img, char_imgs = self.pr.get_cell_imgs(frame, quad)
+                self.plate_pass.add(id_img, char_imgs, score, track_id)
+            return
+        # every plate in view is read
+        readings = [reading for reading in self.pr.read_plates(cv_image) if reading]
+        if readings and acquire_lp:
+            # only update predictions if there has been a prediction and when slowed down 
+            with self.preds_lock, LATENCY.stage("update_predictions"):
+                self.update_predictions(readings, inner)
+
+    def read_plate_pass(self, inner=False):
+        """Reads the best views of each plate collected during the pass, all at once (one call per model), and
+        updates the predictions. Runs on the recognition worker's thread.
+
+        Args:
+            inner (bool, optional): True if called when in the inner loop. Defaulted to False.
+        """
+        cells, track_ids, qualities = self.plate_pass.take_best(Driver.PLATE_PASS_BEST_K)
+        if not cells:
+            return
+        with LATENCY.stage("read plate pass"):
+            readings = [reading for reading in self.pr.read_cells(cells, track_ids, qualities) if reading]
+        if readings:
+            with self.preds_lock, LATENCY.stage("update_predictions"):
+                self.update_predictions(readings, inner)
+
+    def finish_recognition(self, inner=False):
+        """Waits for the recognition in progress to finish, and reads the views of the current plate pass.
+
+        Args:
+            inner (bool, optional): True if called when in the inner loop. Defaulted to False.
+        """
+        self.recognizer.join()
+        self.read_plate_pass(inner)
 
     def can_enter_inner(self, img):
         """Determines wheter or not the robot can enter in the inner loop, when faced towards it at
         an intersection. Specifically, it will move when the truck has passed the intersection
 
         Args:
-            img (cv::Mat): Raw image data from gazebo
+            img (cv::Mat or FrameContext): Raw image data from gazebo
 
         Returns:
             bool: True if the robot can enter the inner loop.
         """        
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_gray = ImageProcessor.crop(img_gray, int(Driver.ROWS/3), int(2*Driver.ROWS/3), int(Driver.COLS/2.65), int(2*Driver.COLS/2.65))
-
-        if self.prev_mse_truck is None:
-            self.prev_mse_truck = img_gray
-            return False
-        cv2.imshow("truck find", img_gray)
-        cv2.waitKey(1)
-        mse = ImageProcessor.compare_frames(self.prev_mse_truck, img_gray)
-        print("mse:", mse)
-        print("truck in, truck out:" , self.was_truck_in, self.was_truck_out)
-        self.prev_mse_truck = img_gray
-        
+        motion = self.truck_motion
         if self.truck_frames_count <= int(Driver.TRUCK_STOP_SECS*Driver.FPS):
             self.truck_frames_count += 1
+            # the view still shakes from braking, the motion is only detected from the frames after
+            motion.reset()
             return False
 
-        if mse < Driver.TRUCK_MSE_OUT_MAX:
+        event = motion.update(img)
+        if Driver.SHOW_DEBUG:
+            cv2.imshow("truck find", motion.prev)
+            cv2.waitKey(1)
+        if event:
+            print("truck view", event, "mse:", motion.score)
+            print("truck in, truck out:" , self.was_truck_in, self.was_truck_out)
+
+        if motion.state == STILL:
             if not self.was_truck_out:
                 self.was_truck_out = True
             if self.was_truck_in and self.was_truck_out:
-                self.prev_mse_truck = None
+                motion.reset()
                 self.truck_frames_count = 0
                 print("truck in, truck out:" , self.was_truck_in, self.was_truck_out)
                 return True
 
-        if mse > Driver.TRUCK_MSE_IN_MIN:
+        if motion.state == MOVING:
             if not self.was_truck_in:
                 self.was_truck_in = True
                 return False
@@ -416,7 +636,9 @@ class Driver:
                 continue
             if not inner and (id == "7" or id == "8"):
                 continue
-            self.id_stats_dict[id][1] = np.around(1.0*self.id_stats_dict[id][1] / self.id_stats_dict[id][0], 3)
+            # weighted average (no readings of weight 0 are kept, see PlateQualityScorer, but never divide by 0)
+            if self.id_stats_dict[id][2] > 0:
+                self.id_stats_dict[id][1] = np.around(1.0*self.id_stats_dict[id][1] / self.id_stats_dict[id][2], 3)
         
         for k in self.lp_dict:
             if ("7" in self.id_dict and "8" in self.id_dict):
@@ -425,13 +647,29 @@ class Driver:
                 if not inner and (k in self.id_dict["7"] or k in self.id_dict["8"]):
                     continue
 
-            val = [1.0*arr / self.lp_dict[k][0] for arr in self.lp_dict[k][1]]
+            if self.lp_dict[k][2] <= 0:
+                continue
+            val = [1.0*arr / self.lp_dict[k][2] for arr in self.lp_dict[k][1]]
             val = [np.around(v,decimals=3) for v in val]
             self.lp_dict[k][1] = np.array(val)
             flg = False
 
-    def update_predictions(self, pred_id, pred_id_vec, pred_lp, pred_lp_vecs, inner=False):
-        """Updates prediction dictionaries for the plate ID and names.
+    def update_predictions(self, readings, inner=False):
+        """Updates prediction dictionaries for the plate ID and names, with the readings of every plate in a frame.
+
+        Args:
+            readings (list[PlateReading]): the readings of the plates (see PlateReader.read_plates)
+            inner (bool, optional): True if called when in the inner loop. Defaulted to False.
+        """        
+        for reading in readings:
+            self.update_prediction(reading.id, reading.id_vec, reading.license, reading.license_vecs, inner, reading.quality)
+            if reading.track_id is not None:
+                track = self.track_dict.setdefault(reading.track_id, {})
+                key = (reading.id, reading.license)
+                track[key] = track.get(key, 0) + 1
+
+    def update_prediction(self, pred_id, pred_id_vec, pred_lp, pred_lp_vecs, inner=False, weight=1.0):
+        """Updates prediction dictionaries for the plate ID and names, with the reading of one plate.
 
         Args:
             pred_id (str): the predicted license plate ID
@@ -439,6 +677,7 @@ class Driver:
             pred_lp (str): the predicted license plate combos
             pred_lp_vecs (ndarray): s 2D numpy array, where each element is the predicited probabilties for the corresponding character
             inner (bool, optional): True if called when in the inner loop. Defaulted to False.
+            weight (float, optional): weight of the reading (e.g. the quality of the view of the plate). Defaulted to 1.
         """        
         # id -> set[license plates]
         if not inner and (pred_id == "7" or pred_id =="8"):
@@ -446,41 +685,37 @@ class Driver:
         if not pred_id in self.id_dict:
             self.id_dict[pred_id] = set()
         self.id_dict[pred_id].add(pred_lp)
-        # id -> (freq, prediction vector)
+        # id -> (freq, weighted prediction vector, total weight)
         if not pred_id in self.id_stats_dict:
-            self.id_stats_dict[pred_id] = [1,pred_id_vec]
+            self.id_stats_dict[pred_id] = [1, weight*np.array(pred_id_vec), weight]
         else:
             self.id_stats_dict[pred_id][0] += 1
-            self.id_stats_dict[pred_id][1] += pred_id_vec
-        # license plates -> (freq, prediction vector)
+            self.id_stats_dict[pred_id][1] += weight*np.array(pred_id_vec)
+            self.id_stats_dict[pred_id][2] += weight
+        # license plates -> (freq, weighted prediction vector, total weight)
         if not pred_lp in self.lp_dict:
-            self.lp_dict[pred_lp] = [1, pred_lp_vecs]
+            self.lp_dict[pred_lp] = [1, weight*np.array(pred_lp_vecs), weight]
         else:
             self.lp_dict[pred_lp][0] += 1
-            self.lp_dict[pred_lp][1] += pred_lp_vecs
+            self.lp_dict[pred_lp][1] += weight*np.array(pred_lp_vecs)
+            self.lp_dict[pred_lp][2] += weight
             # self.lp_dict[pred_lp] = (freq, p_v)
 
     def is_straightened(self, img):
         """ Determines whether or not the robot is straightened to the red line
 
         Args:
-            img (cv::Mat): Raw image data
+            img (cv::Mat or FrameContext): Raw image data
 
         Returns:
             int: -2 if error state, -1 if currently to the left, 0 if straight within thres, 1 if currently to the right
         """        
-        red_im = ImageProcessor.filter_red(img)
-        edges = cv2.Canny(red_im,50,150,apertureSize = 3)
-        minLineLength=100
-        lines = cv2.HoughLinesP(image=edges,rho=1,theta=np.pi/180, threshold=100,lines=np.array([]), minLineLength=minLineLength,maxLineGap=80)
-        if list(lines):
-            x1,y1,x2,y2 = lines[0][0].tolist()
-            deg = 0
-            if x1 == x2:
-                print("--- x1=x2 ---",x1,x2)
-                return (-2,-2)
-            deg = np.rad2deg(np.arctan((y2-y1)/(x2-x1)))
-            print(deg)
+        with LATENCY.stage("red line fit"):
+            fit = self.red_line_detector.fit_line(img)
+        self.red_line_fit = fit
+        if fit.confidence >= Driver.MIN_LINE_CONFIDENCE:
+            deg = fit.angle
+            print(deg, fit.offset, fit.confidence)
             ang_state = 0
             lin_state = 0
             if abs(deg) < Driver.STRAIGHT_DEGS_THRES:
@@ -489,7 +724,7 @@ class Driver:
                 ang_state = -1
             else:
                 ang_state = 1
-            y = (y1+y2)/2.0
+            y = fit.offset
             y_tgt = Driver.RED_INTERSEC_PIX
             y_thres = Driver.RED_INTERSEC_PIX_THRES
             if y < y_tgt + y_thres and y > y_tgt - y_thres:
@@ -522,6 +757,13 @@ class Driver:
             for c in self.lp_dict[k][1]:
                 maxs.append(np.amax(c))
             print("MAXS: ", maxs)
+        print("\n")
+        print(GATES.report())
+        print(PREDICTION_CACHE.report())
+        print("TRACKS (readings of each physical plate)")
+        for track_id, readings in self.track_dict.items():
+            print("----", track_id, "-----")
+            print(readings)
 
     def get_plate_results(self, inner=False):
         """Obtains the best predictions for each license plate ID.
@@ -535,9 +777,9 @@ class Driver:
             best_lp = None
             best_lp_freqs = 0
             for lp in self.id_dict[id]:
-                # highest freqs
-                if best_lp_freqs < self.lp_dict[lp][0]:
-                    best_lp_freqs = self.lp_dict[lp][0]
+                # highest freqs, weighted by the quality of the readings
+                if best_lp_freqs < self.lp_dict[lp][2]:
+                    best_lp_freqs = self.lp_dict[lp][2]
                     best_lp = lp
                 combos[id] = best_lp
 
@@ -565,19 +807,19 @@ class Driver:
         best_lp = None
         best_lp_freqs = 0
         for lp in self.id_dict[id_str]:
-            if best_lp_freqs < self.lp_dict[lp][0]:
-                # highest freqs
-                best_lp_freqs = self.lp_dict[lp][0]
+            if best_lp_freqs < self.lp_dict[lp][2]:
+                # highest freqs, weighted by the quality of the readings
+                best_lp_freqs = self.lp_dict[lp][2]
                 best_lp = lp
-            elif best_lp_freqs == self.lp_dict[lp][0]:
+            elif best_lp_freqs == self.lp_dict[lp][2]:
                 # if tie, then get one with higher magnitude of max of all prediction vectors
                 maxs_curr_best = np.array([np.amax(v) for v in self.lp_dict[best_lp][1]])
                 maxs_lp = np.array([np.amax(v) for v in self.lp_dict[lp][1]])
                 if np.sum(maxs_curr_best**2) < np.sum(maxs_lp**2):
-                    best_lp_freqs = self.lp_dict[lp][0]
+                    best_lp_freqs = self.lp_dict[lp][2]
                     best_lp = lp
                 else:
-                    best_lp_freqs = self.lp_dict[lp][0]
+                    best_lp_freqs = self.lp_dict[lp][2]
                     best_lp = lp
             self.results[id_str] = best_lp
 
@@ -593,18 +835,14 @@ class Driver:
         """Determines whether or not the robot is close to the red line.
 
         Args:
-            img (cv::Mat): The raw RGB image data to check if there is a red line
+            img (cv::Mat or FrameContext): The raw RGB image data to check if there is a red line
 
         Returns:
             bool: True if deemed close to the red line, False otherwise.
         """        
-        red_filt = ImageProcessor.filter(img, ImageProcessor.red_low, ImageProcessor.red_up)
-        area = PlatePull.get_contours_area(red_filt,2)
-        if not list(area):
-            return False
-        if len(list(area)) == 1:
-            return area[0] > Driver.CROSSWALK_FRONT_AREA_THRES
-        return area[0] > Driver.CROSSWALK_FRONT_AREA_THRES
+        with LATENCY.stage("red line"):
+            self.red_line = self.red_line_detector.detect(img)
+        return self.red_line.close
     
     @staticmethod
     def has_red_line(img):
@@ -624,34 +862,33 @@ class Driver:
         - Robot must see the pedestrian to be in a stopped state.
 
         Args:
-            img (cv::Mat): Raw RGB iamge data
+            img (cv::Mat or FrameContext): Raw RGB iamge data
 
         Returns:
             bool: True if the robot able to cross crosswalk, False otherwise
         """        
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_gray = ImageProcessor.crop(img_gray, 180, 720-180, 320, 1280-320)
-        cv2.imshow("Crosswalk view", img_gray)
-        cv2.waitKey(1)
-        if self.prev_mse_frame is None:
-            self.prev_mse_frame = img_gray
-            return False
-        
-        mse = ImageProcessor.compare_frames(self.prev_mse_frame, img_gray)
-        self.prev_mse_frame = img_gray
-        
+        motion = self.crosswalk_motion
         if self.first_stopped_frames_count <= int(Driver.FIRST_STOP_SECS*Driver.FPS):
             self.first_stopped_frames_count += 1
+            # the view still shakes from braking, the motion is only detected from the frames after
+            motion.reset()
             return False
-        if mse < Driver.CROSSWALK_MSE_STOPPED_THRES:
+
+        event = motion.update(img)
+        if Driver.SHOW_DEBUG:
+            cv2.imshow("Crosswalk view", motion.prev)
+            cv2.waitKey(1)
+        if event:
+            print("crosswalk view", event, "mse:", motion.score)
+        if motion.state == STILL:
             if not self.first_ped_stopped:
                 self.first_ped_stopped = True
                 return False
             if self.first_ped_moved and self.first_ped_stopped:
-                self.prev_mse_frame = None
+                motion.reset()
                 self.first_stopped_frames_count = 0
                 return True
-        if mse > Driver.CROSSWALK_MSE_MOVING_THRES:
+        if motion.state == MOVING:
             if not self.first_ped_moved:
                 self.first_ped_moved = True
                 return False
@@ -715,7 +952,7 @@ class Driver:
         x = 0
         crped = ImageProcessor.crop(cv_image, row_start=int(720/2.2))
         blu_crped = ImageProcessor.filter_blue(crped)
-        largest_blu_area = ImageProcessor.contours_area(blu_crped)[0]
+        largest_blu_area = top_contours(blu_crped).largest_area
         print("largest blue area", largest_blu_area)
         if largest_blu_area and largest_blu_area > Driver.BLUE_AREA_THRES_TURN:
             z = 0
@@ -750,11 +987,14 @@ class Driver:
         
 def main(args):    
     rospy.init_node('Driver', anonymous=True)
+    STARTUP.mark("init node")
     dv = Driver()
     try:
         rospy.spin()
     except KeyboardInterrupt:
         ("Shutting down")
+    dv.mailbox.close()
+    print(dv.mailbox.report())
     cv2.destroyAllWindows()
     print("end")
 
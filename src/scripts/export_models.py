@@ -0,0 +1,162 @@
+#! /usr/bin/env python3
+
+import argparse
+import os
+import cv2
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import models
+from PIL import Image
+
+from bench_inference import MODELS_DIR, time_predictor
+from inference import FastPredictor, TFLitePredictor, exported_path
+
+"""
+Exports the keras (.h5) models to TFLite, next to the original model, so that they can be loaded
+with the "tflite" / "tflite-int8" backends of Model and CharReader (see inference.py).
+
+For every model, reports the agreement of the exported model with the keras model, the accuracy
+on the labelled character data (alpha/num readers only) and the per-inference latency.
+"""
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+"""model name prefix -> (calibration data, labelled evaluation data, first label character)"""
+DATASETS = {
+    'alpha': ('alpha-data-compressed', 'alpha-edge-data', 'A'),
+    'num': ('num-data-compressed', 'num-edge-data', '0'),
+    # the parking IDs are digits as well, no labelled ID data is bundled
+    'id': ('num-data-compressed', None, '1'),
+}
+CALIBRATION_SAMPLES = 300
+
+
+def load_images(folder, shape, max_imgs=None):
+    """Loads the (grayscale) images of a folder in the format of the model input.
+
+    Args:
+        folder (str): folder containing the images
+        shape (tuple[int]): model input shape (rows, cols, channels)
+        max_imgs (int, optional): maximum number of images to load. Defaults to all of them.
+
+    Returns:
+        tuple[ndarray, list[str]]: the normalized images, and the character each file name is labelled with
+    """
+    rows, cols = shape[:2]
+    file_list = sorted(os.listdir(folder))[:max_imgs]
+    imgs = []
+    labels = []
+    for filename in file_list:
+        img = np.array(Image.open(os.path.join(folder, filename)))
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        imgs.append(cv2.resize(img, (cols, rows)))
+        # plate_<char><random>.png
+        labels.append(filename[6])
+    imgs = np.expand_dims(np.array(imgs, dtype=np.float32) / 255, axis=-1)
+    return imgs, labels
+
+
+def convert(model, calib_imgs=None):
+    """Converts a keras model to TFLite.
+
+    Args:
+        model (keras.Model): model to convert
+        calib_imgs (ndarray, optional): normalized model inputs to calibrate a full int8 quantization with.
+            Defaults to None (float32 model).
+
+    Returns:
+        bytes: the TFLite model
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calib_imgs is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([img[np.newaxis]] for img in calib_imgs)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def evaluate(predictor, imgs):
+    """Top predictions of a predictor, one sample at a time (i.e. as on the robot).
+
+    Args:
+        predictor (FastPredictor or TFLitePredictor): predictor to evaluate
+        imgs (ndarray): normalized model inputs
+
+    Returns:
+        ndarray: index of the top prediction of each input
+    """
+    return np.array([np.argmax(predictor.predict(img[np.newaxis])[0]) for img in imgs])
+
+
+def export_model(path, int8=False, calib_dir=None):
+    """Exports a keras model to TFLite and prints how the exported models compare to it.
+
+    Args:
+        path (str): path of the keras (.h5) model
+        int8 (bool, optional): True to also export an int8 quantized model. Defaults to False.
+        calib_dir (str, optional): folder of calibration images, for models that are not character readers. Defaults to None.
+    """
+    filename = os.path.basename(path)
+    model = models.load_model(path)
+    shape = model.input_shape[1:]
+    prefix = filename.split('_')[0]
+    calib_dir, eval_dir, first_char = DATASETS.get(prefix, (calib_dir, None, None))
+    calib_imgs = None
+    if calib_dir is not None:
+        calib_imgs = load_images(os.path.join(DATA_DIR, calib_dir), shape, CALIBRATION_SAMPLES)[0]
+
+    backends = {'tflite': convert(model)}
+    if int8:
+        if calib_imgs is None:
+            print(f"{filename}: no calibration data, skipping int8")
+        else:
+            backends['tflite-int8'] = convert(model, calib_imgs)
+
+    reference = FastPredictor(model)
+    sample = np.random.rand(1, *shape).astype(np.float32)
+    eval_imgs, eval_labels = None, None
+    if eval_dir is not None:
+        eval_imgs, labels = load_images(os.path.join(DATA_DIR, eval_dir), shape)
+        eval_labels = np.array([ord(c) - ord(first_char) for c in labels])
+    check_imgs = eval_imgs if eval_imgs is not None else calib_imgs
+
+    results = [('keras', reference)]
+    for backend, tflite_model in backends.items():
+        out_path = exported_path(path, backend)
+        with open(out_path, 'wb') as f:
+            f.write(tflite_model)
+        results.append((backend, TFLitePredictor(out_path)))
+
+    ref_preds = evaluate(reference, check_imgs) if check_imgs is not None else None
+    ref_acc = None
+    for backend, predictor in results:
+        line = f"{filename:<24}{backend:<14}"
+        if ref_preds is not None:
+            preds = evaluate(predictor, check_imgs)
+            line += f"agreement {np.mean(preds == ref_preds):7.2%}  "
+            if eval_labels is not None:
+                acc = np.mean(preds == eval_labels)
+                ref_acc = acc if ref_acc is None else ref_acc
+                line += f"accuracy {acc:7.2%} (delta {acc - ref_acc:+7.2%})  "
+        times = time_predictor(predictor, sample)
+        line += f"latency p50 {np.median(times):.3f} ms, mean {np.mean(times):.3f} ms"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports the keras models to TFLite.')
+    parser.add_argument('models_dir', nargs='?', default=MODELS_DIR, help='folder containing the .h5 models')
+    parser.add_argument('--int8', action='store_true', help='also export int8 quantized models')
+    parser.add_argument('--calib-dir', default=None,
+                        help='calibration images for the models that are not character readers (e.g. the scraped drive data)')
+    args = parser.parse_args()
+
+    for filename in sorted(os.listdir(args.models_dir)):
+        if filename.endswith('.h5'):
+            export_model(os.path.join(args.models_dir, filename), args.int8, args.calib_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#! /usr/bin/env python3
+
+import threading
+import cv2
+import numpy as np
+
+from hsv_view import ImageProcessor
+
+
+class FrameContext:
+    """This class holds a single camera frame and lazily caches everything derived from it
+    (hsv image, grayscale image and the named hsv masks), so that each colour conversion
+    is only paid once per frame no matter how many detectors look at it.
+    Can be shared between the control loop and the recognition worker.
+    """
+
+    """name -> (hsv lower bound, hsv upper bound, filter)"""
+    MASKS = {
+        "white": (ImageProcessor.white_low, ImageProcessor.white_up, ImageProcessor.filter_hsv),
+        "blue": (ImageProcessor.blue_low, ImageProcessor.blue_up, ImageProcessor.filter_hsv),
+        "red": (ImageProcessor.red_low, ImageProcessor.red_up, ImageProcessor.filter_hsv),
+        "plate": (ImageProcessor.plate_low, ImageProcessor.plate_up, ImageProcessor.filter_plate_hsv),
+    }
+
+    def __init__(self, img, type="bgr"):
+        """Creates a FrameContext object for one frame.
+
+        Args:
+            img (cv::Mat): raw image data of the frame
+            type (str): (Optional) the channel type of the image data. Assumed to be "bgr"
+        """
+        self.img = img
+        self.type = type
+        self._hsv = None
+        self._gray = None
+        self._masks = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def of(img):
+        """Wraps the raw image in a FrameContext, unless it already is one.
+
+        Args:
+            img (cv::Mat or FrameContext): raw image data or an existing frame context
+
+        Returns:
+            FrameContext: the context of the frame
+        """
+        if isinstance(img, FrameContext):
+            return img
+        return FrameContext(img)
+
+    @property
+    def hsv(self):
+        """cv::Mat: hsv image of the whole frame, converted on first access."""
+        with self._lock:
+            if self._hsv is None:
+                code = cv2.COLOR_RGB2HSV if self.type == "rgb" else cv2.COLOR_BGR2HSV
+                self._hsv = cv2.cvtColor(self.img, code)
+            return self._hsv
+
+    @property
+    def gray(self):
+        """cv::Mat: grayscale image of the whole frame, converted on first access."""
+        with self._lock:
+            if self._gray is None:
+                code = cv2.COLOR_RGB2GRAY if self.type == "rgb" else cv2.COLOR_BGR2GRAY
+                self._gray = cv2.cvtColor(self.img, code)
+            return self._gray
+
+    def mask(self, name, row_start=0):
+        """Binary mask of the frame for one of the named hsv ranges (see FrameContext.MASKS).
+        The mask is computed from the cached hsv image and cached itself.
+
+        Args:
+            name (str): name of the mask, one of white, blue, red, plate
+            row_start (int): (Optional) first row of the frame the mask should cover. Defaults to 0.
+
+        Returns:
+            cv::Mat: the binary mask
+        """
+        key = (name, row_start)
+        with self._lock:
+            if key not in self._masks:
+                low, up, filt = FrameContext.MASKS[name]
+                hsv = self.hsv
+                if row_start:
+                    hsv = ImageProcessor.crop(hsv, row_start=row_start)
+                self._masks[key] = filt(hsv, low, up)
+            return self._masks[key]
+
+    def hsv_rows(self, row_start=0, step=1):
+        """Hsv image of the lower part of the frame, subsampled by step in both directions.
+        Sliced from the hsv image of the whole frame if it has already been converted, otherwise only
+        the sampled pixels are converted (and nothing is cached).
+
+        Args:
+            row_start (int): (Optional) first row of the frame. Defaults to 0.
+            step (int): (Optional) keep one pixel out of step, in both directions. Defaults to 1.
+
+        Returns:
+            cv::Mat: the hsv image
+        """
+        with self._lock:
+            if self._hsv is not None:
+                return self._hsv[row_start::step, ::step]
+        code = cv2.COLOR_RGB2HSV if self.type == "rgb" else cv2.COLOR_BGR2HSV
+        return cv2.cvtColor(np.ascontiguousarray(self.img[row_start::step, ::step]), code)
+
+    def mask_window(self, name, row_start, row_end, col_start, col_end):
+        """Binary mask of a window of the frame for one of the named hsv ranges (see FrameContext.MASKS).
+        Sliced from the hsv image of the whole frame if it has already been converted, otherwise only the
+        window is converted. Not cached.
+
+        Args:
+            name (str): name of the mask, one of white, blue, red, plate
+            row_start (int): first row of the window
+            row_end (int): end row of the window (not inclusive)
+            col_start (int): first column of the window
+            col_end (int): end column of the window (not inclusive)
+
+        Returns:
+            cv::Mat: the binary mask of the window
+        """
+        low, up, filt = FrameContext.MASKS[name]
+        with self._lock:
+            hsv = self._hsv
+        if hsv is not None:
+            hsv = hsv[row_start:row_end, col_start:col_end]
+        else:
+            code = cv2.COLOR_RGB2HSV if self.type == "rgb" else cv2.COLOR_BGR2HSV
+            hsv = cv2.cvtColor(self.img[row_start:row_end, col_start:col_end], code)
+        return filt(hsv, low, up)
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+
+import threading
+import time
+
+
+class FrameMailbox:
+    """This class is a single-slot mailbox between the camera subscriber and the thread processing frames.
+
+    Only the newest frame is kept: a frame that has not been taken yet when the next one arrives
+    is dropped (and counted), so the processing thread never works on a backlog of stale frames.
+    """
+
+    def __init__(self):
+        """Creates an empty FrameMailbox object."""
+        self.cond = threading.Condition()
+        self.frame = None
+        self.received_t = 0
+        self.closed = False
+        """stats"""
+        self.received_count = 0
+        self.dropped_count = 0
+        self.processed_count = 0
+        self.age_sum = 0
+        self.max_age = 0
+
+    def put(self, frame):
+        """Puts a new frame in the mailbox, replacing (dropping) the previous one if it has not been taken.
+        Meant to be the callback of the camera subscriber.
+
+        Args:
+            frame (sensor_msgs::Image): the new frame
+        """
+        with self.cond:
+            if self.frame is not None:
+                self.dropped_count += 1
+            self.frame = frame
+            self.received_t = time.monotonic()
+            self.received_count += 1
+            self.cond.notify()
+
+    def take(self, timeout=None):
+        """Takes the newest frame out of the mailbox, waiting for one if it is empty.
+
+        Args:
+            timeout (float, optional): max seconds to wait for a frame. Defaults to None (wait forever).
+
+        Returns:
+            tuple[sensor_msgs::Image, float]: the frame and its age (seconds since it was received).
+                (None, None) if no frame arrived within the timeout or the mailbox was closed.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame is not None or self.closed, timeout)
+            if self.frame is None:
+                return None, None
+            frame = self.frame
+            self.frame = None
+            age = time.monotonic() - self.received_t
+            self.processed_count += 1
+            self.age_sum += age
+            self.max_age = max(self.max_age, age)
+        return frame, age
+
+    def close(self):
+        """Wakes up and stops any thread waiting on the mailbox."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def report(self):
+        """Summary of the frames received, dropped and processed, and of the frame age when processed.
+
+        Returns:
+            str: the summary
+        """
+        with self.cond:
+            mean_age = self.age_sum / self.processed_count if self.processed_count else 0
+            return (f"frames received {self.received_count}, processed {self.processed_count}, dropped {self.dropped_count}, "
+                    f"age mean {mean_age*1000:.1f} ms, max {self.max_age*1000:.1f} ms")
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+
+import threading
+
+
+class GateCounters:
+    """This class counts the frames passed and rejected by each stage of the cascade gating the plate
+    recognition: the cheap checks run first, and the cnns only run on the frames that passed every stage.
+    """
+
+    def __init__(self):
+        """Creates a GateCounters object."""
+        """stage -> [passed, rejected], in the order the stages were first checked"""
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def check(self, stage, passed):
+        """Counts a frame at a stage.
+
+        Args:
+            stage (str): name of the stage
+            passed (bool): True if the frame passed the stage
+
+        Returns:
+            bool: passed, so that the check can be used as a condition
+        """
+        passed = bool(passed)
+        with self.lock:
+            counts = self.counts.setdefault(stage, [0, 0])
+            counts[0 if passed else 1] += 1
+        return passed
+
+    def stats(self):
+        """Returns:
+            list[dict]: the stage, passed and rejected counts of each stage, in order
+        """
+        with self.lock:
+            return [{"stage": stage, "passed": p, "rejected": r} for stage, (p, r) in self.counts.items()]
+
+    def report(self):
+        """Summary of each stage, and of the share of the frames that did not reach the cnns.
+
+        Returns:
+            str: the summary
+        """
+        stats = self.stats()
+        if not stats:
+            return "gating: no frames"
+        total = stats[0]["passed"] + stats[0]["rejected"]
+        inferred = stats[-1]["passed"]
+        stages = ", ".join(f"{s['stage']} {s['passed']}/{s['passed'] + s['rejected']}" for s in stats)
+        avoided = 100.0 * (total - inferred) / total if total else 0
+        return f"gating: {stages} passed; inference avoided on {avoided:.1f}% of {total} frames"
+
+
+"""process-wide counters shared by the driver and the plate reader"""
+GATES = GateCounters()
@@ -1,7 +1,6 @@
 #! /usr/bin/env python3
 
 from __future__ import print_function
-from concurrent.futures import process
 
 #import roslib; roslib.load_manifest('node')
 import sys
@@ -11,7 +10,7 @@ import time
 import numpy as np
 from sensor_msgs.msg import Image
 from cv_bridge import CvBridge, CvBridgeError
-from skimage.metrics import mean_squared_error
+from contour_stats import top_areas
 
 class ImageProcessor:
     """This class handles any image processing-related needs.
@@ -65,6 +64,19 @@ class ImageProcessor:
             hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
         if type == "bgr":
             hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        return ImageProcessor.filter_hsv(hsv, hsv_low, hsv_up)
+
+    @staticmethod
+    def filter_hsv(hsv, hsv_low, hsv_up):
+        """Same as filter, but for an image that has already been converted to hsv.
+
+        Args:
+            hsv (cv::Mat): hsv image data to filter
+            hsv_low (list[int]): a list of the lower bound of the hue, saturation, value  
+            hsv_up (list[int]): a list of the upper bound of the hue, saturation, value
+        Returns:
+            cv::Mat: the procesed image (binary image)
+        """
         mask = cv2.inRange(hsv, np.array(hsv_low), np.array(hsv_up))
         blur = cv2.GaussianBlur(mask, (3, 3), 0)
         return blur
@@ -84,9 +96,11 @@ class ImageProcessor:
             bin_img2 (cv::Mat): binary image to compare
 
         Returns:
-            float: the error between the images
+            float: the error between the images (mean squared error)
         """        
-        return mean_squared_error(bin_img1, bin_img2)
+        if bin_img1.dtype == bin_img2.dtype:
+            return cv2.norm(bin_img1, bin_img2, cv2.NORM_L2SQR) / bin_img1.size
+        return float(np.mean(np.square(bin_img1.astype(np.float64) - bin_img2)))
 
     @staticmethod
     def crop(img, row_start=-1, row_end=-1, col_start=-1, col_end=-1):
@@ -127,6 +141,20 @@ class ImageProcessor:
             cv::Mat: the processed image containing the license plate.
         """        """"""
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        return ImageProcessor.filter_plate_hsv(hsv, hsv_low, hsv_up)
+
+    @staticmethod
+    def filter_plate_hsv(hsv, hsv_low, hsv_up):
+        """Same as filter_plate, but for an image that has already been converted to hsv.
+
+        Args:
+            hsv (cv::Mat): hsv image respresenting the license plate
+            hsv_low (list[int]): a list of the lower bound of the hue, saturation, value  
+            hsv_up (list[int]): a list of the upper bound of the hue, saturation, value
+
+        Returns:
+            cv::Mat: the processed image containing the license plate.
+        """
         mask = cv2.inRange(hsv, np.array(hsv_low), np.array(hsv_up))
         blur = cv2.GaussianBlur(mask, (5, 5), 0)
         dil = cv2.erode(blur, (9, 9))
@@ -147,14 +175,9 @@ class ImageProcessor:
             print(e)
         self.truck_test(cv_image)
 
+    @staticmethod
     def contours_area(img,nums=1):
-        contours, hierarchy = cv2.findContours(
-            image=img, mode=cv2.RETR_TREE, method=cv2.CHAIN_APPROX_NONE)
-        cs = sorted(contours, key=cv2.contourArea, reverse=True)
-        if len(cs) > nums:
-            cs = cs[:nums]
-        areas = [cv2.contourArea(c) for c in cs] 
-        return areas
+        return top_areas(img, nums)
     
     def blue_area(self, cv_image):
         crped = ImageProcessor.crop(cv_image, row_start=int(720/2.2))
@@ -0,0 +1,194 @@
+#! /usr/bin/env python3
+
+import os
+import numpy as np
+
+
+class KerasPredictor:
+    """This class runs a keras model through keras.Model.predict (the default backend).
+    """
+
+    def __init__(self, model):
+        """Creates a KerasPredictor object.
+
+        Args:
+            model (keras.Model): loaded keras model
+        """
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+
+    def predict(self, batch):
+        """Prediction vectors for a batch of model inputs.
+
+        Args:
+            batch (ndarray): normalized model inputs, with the batch as the first dimension
+
+        Returns:
+            ndarray: 2D array, each row being the prediction vector of the corresponding input
+        """
+        return self.model.predict(batch)
+
+
+class FastPredictor:
+    """This class runs a keras model through a traced tf.function with a fixed input signature.
+
+    keras.Model.predict builds a data adapter and a new execution loop on every call, which
+    dominates the cost of a batch of one on these small cnns. The traced function is only built
+    once, and single inputs are copied into a preallocated float32 buffer.
+    """
+
+    def __init__(self, model):
+        """Creates a FastPredictor object.
+
+        Args:
+            model (keras.Model): loaded keras model
+        """
+        import tensorflow as tf
+
+        self.model = model
+        self.input_shape = shape = tuple(model.input_shape[1:])
+        self.input = np.zeros((1,) + shape, dtype=np.float32)
+        self.fn = tf.function(lambda x: model(x, training=False),
+                              input_signature=[tf.TensorSpec(shape=(None,) + shape, dtype=tf.float32)])
+
+    def predict(self, batch):
+        """Prediction vectors for a batch of model inputs.
+
+        Args:
+            batch (ndarray): normalized model inputs, with the batch as the first dimension
+
+        Returns:
+            ndarray: 2D array, each row being the prediction vector of the corresponding input
+        """
+        if len(batch) == 1:
+            self.input[0] = batch[0]
+            x = self.input
+        else:
+            x = np.asarray(batch, dtype=np.float32)
+        return self.fn(x).numpy()
+
+
+class TFLitePredictor:
+    """This class runs a model exported by export_models.py with the TFLite interpreter.
+
+    Uses the standalone tflite_runtime package when it is installed, so that full tensorflow is
+    never imported. Quantized (int8) models are quantized/dequantized at the input and output.
+    """
+
+    def __init__(self, path):
+        """Creates a TFLitePredictor object.
+
+        Args:
+            path (str): path of the .tflite model
+        """
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.model = None
+        self.interpreter = Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = self.input_details['shape'][0]
+        self.input_shape = tuple(self.input_details['shape'][1:])
+
+    def predict(self, batch):
+        """Prediction vectors for a batch of model inputs.
+
+        Args:
+            batch (ndarray): normalized model inputs, with the batch as the first dimension
+
+        Returns:
+            ndarray: 2D array, each row being the prediction vector of the corresponding input
+        """
+        if len(batch) != self.batch_size:
+            # only reallocates when the batch size changes
+            shape = list(self.input_details['shape'])
+            shape[0] = len(batch)
+            self.interpreter.resize_tensor_input(self.input_details['index'], shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(batch)
+
+        x = np.asarray(batch, dtype=np.float32)
+        scale, zero_point = self.input_details['quantization']
+        if scale:
+            x = np.clip(np.round(x / scale + zero_point), -128, 127)
+        self.interpreter.set_tensor(self.input_details['index'], x.astype(self.input_details['dtype']))
+        self.interpreter.invoke()
+
+        y = self.interpreter.get_tensor(self.output_details['index'])
+        scale, zero_point = self.output_details['quantization']
+        if scale:
+            y = (y.astype(np.float32) - zero_point) * scale
+        return y
+
+
+"""backend -> predictor wrapping a loaded keras model"""
+KERAS_BACKENDS = {
+    "keras": KerasPredictor,
+    "fast": FastPredictor,
+}
+"""backend -> suffix of the exported file, replacing the .h5 extension (see export_models.py)"""
+TFLITE_BACKENDS = {
+    "tflite": ".tflite",
+    "tflite-int8": "_int8.tflite",
+}
+"""the model is run by the shared inference service (see inference_service.py)"""
+SERVICE_BACKEND = "service"
+BACKENDS = list(KERAS_BACKENDS) + list(TFLITE_BACKENDS) + [SERVICE_BACKEND]
+
+
+def exported_path(path, backend):
+    """Path of the exported model for a TFLite backend, saved next to the keras model.
+
+    Args:
+        path (str): path of the keras (.h5) model
+        backend (str): one of TFLITE_BACKENDS
+
+    Returns:
+        str: path of the exported model
+    """
+    return os.path.splitext(path)[0] + TFLITE_BACKENDS[backend]
+
+
+def import_backend(backend):
+    """Imports the (heavy) modules an inference backend needs, so that the import can be timed
+    and done before the models are loaded in parallel.
+
+    Args:
+        backend (str): one of BACKENDS
+    """
+    if backend in KERAS_BACKENDS:
+        import tensorflow
+    elif backend in TFLITE_BACKENDS:
+        try:
+            import tflite_runtime.interpreter
+        except ImportError:
+            import tensorflow
+
+
+def load_predictor(path, backend="keras"):
+    """Loads a trained model and wraps it with the chosen inference backend.
+
+    Args:
+        path (str): path where the trained (keras) model is saved. The TFLite backends load the
+            exported model saved next to it instead, the service backend sends the path to the service.
+        backend (str, optional): one of BACKENDS. Defaults to "keras".
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        KerasPredictor, FastPredictor, TFLitePredictor or RemotePredictor: the model, ready for inference
+    """
+    if backend == SERVICE_BACKEND:
+        from inference_service import RemotePredictor
+        return RemotePredictor(path)
+    if backend in TFLITE_BACKENDS:
+        return TFLitePredictor(exported_path(path, backend))
+    if backend not in KERAS_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    from tensorflow.keras import models
+    return KERAS_BACKENDS[backend](models.load_model(path))
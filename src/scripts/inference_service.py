@@ -0,0 +1,245 @@
+#! /usr/bin/env python3
+
+import argparse
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+from inference import load_predictor
+
+"""
+Local inference service: loads each model once and serves every perception consumer (Driver,
+PlateReader, PlatePull, offline tools) over a unix socket. Requests that arrive within a short
+window are gathered into one batched forward pass per model.
+
+Consumers use it as a drop-in through the "service" backend of Model and CharReader, e.g.
+CharReader(path, backend="service"), once the service has been started with:
+    python3 inference_service.py
+"""
+
+SOCKET_PATH = '/tmp/enph353_inference.sock'
+AUTHKEY = b'enph353'
+BATCH_WINDOW_SECS = 0.002
+MAX_BATCH = 64
+
+
+class InferenceServer:
+    """This class handles the server side of the inference service.
+    """
+
+    def __init__(self, address=SOCKET_PATH, backend="fast", window=BATCH_WINDOW_SECS, max_batch=MAX_BATCH):
+        """Creates an InferenceServer object.
+
+        Args:
+            address (str, optional): path of the unix socket to listen on. Defaults to SOCKET_PATH.
+            backend (str, optional): inference backend the models are run with (see inference.BACKENDS). Defaults to "fast".
+            window (float, optional): seconds to wait for more requests after the first one of a batch. Defaults to BATCH_WINDOW_SECS.
+            max_batch (int, optional): number of samples after which a batch is run without waiting. Defaults to MAX_BATCH.
+        """
+        self.address = address
+        self.backend = backend
+        self.window = window
+        self.max_batch = max_batch
+        """model path -> predictor, each model is only loaded once"""
+        self.predictors = {}
+        self.load_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.batches_count = 0
+        self.samples_count = 0
+
+    def serve_forever(self):
+        """Accepts clients until the process is killed. Each client is served by its own thread,
+        while a single thread runs the batched forward passes.
+        """
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        listener = Listener(self.address, family='AF_UNIX', authkey=AUTHKEY)
+        threading.Thread(target=self.batch_loop, daemon=True).start()
+        print("inference service listening on", self.address)
+        try:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.handle_client, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def handle_client(self, conn):
+        """Queues every request sent by a client, until it disconnects.
+
+        Args:
+            conn (multiprocessing.connection.Connection): connection to the client
+        """
+        try:
+            while True:
+                request = conn.recv()
+                try:
+                    path, batch = request
+                    if batch is None:
+                        # handshake, replies with the model's input shape (loading it if needed)
+                        conn.send(self.predictor(path).input_shape)
+                        continue
+                except (EOFError, OSError):
+                    raise
+                except Exception as e:
+                    # e.g. a model that fails to load: the client raises it instead of waiting for a reply
+                    print("request failed:", e)
+                    send_error(conn, e)
+                    continue
+                self.requests.put((conn, path, batch))
+        except (EOFError, OSError):
+            conn.close()
+
+    def batch_loop(self):
+        """Gathers the requests that arrive within the batching window and runs them."""
+        while True:
+            pending = [self.requests.get()]
+            num_samples = len(pending[0][2])
+            deadline = time.monotonic() + self.window
+            while num_samples < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                num_samples += len(pending[-1][2])
+            self.run_batch(pending)
+
+    def run_batch(self, pending):
+        """Runs one forward pass per model over all the pending requests and replies to each client.
+
+        Args:
+            pending (list[tuple]): requests, each being (connection, model path, batch)
+        """
+        by_model = {}
+        for request in pending:
+            by_model.setdefault(request[1], []).append(request)
+
+        for path, requests in by_model.items():
+            try:
+                batch = np.concatenate([batch for _, _, batch in requests])
+                preds = self.predictor(path).predict(batch)
+                self.batches_count += 1
+                self.samples_count += len(batch)
+            except Exception as e:
+                print("batch failed:", e)
+                preds = e
+
+            i = 0
+            for conn, _, batch in requests:
+                if isinstance(preds, Exception):
+                    send_error(conn, preds)
+                    continue
+                try:
+                    conn.send(preds[i:i + len(batch)])
+                except OSError:
+                    # client disconnected while waiting
+                    pass
+                i += len(batch)
+
+    def predictor(self, path):
+        """Predictor of a model, loaded on the first request for it.
+
+        Args:
+            path (str): path where the trained model is saved
+
+        Returns:
+            KerasPredictor, FastPredictor or TFLitePredictor: the model, ready for inference
+        """
+        with self.load_lock:
+            if path not in self.predictors:
+                print("loading", path)
+                self.predictors[path] = load_predictor(path, self.backend)
+            return self.predictors[path]
+
+
+def send_error(conn, error):
+    """Sends an error to a client, to be raised by it. Errors that cannot be pickled are sent as a RuntimeError.
+
+    Args:
+        conn (multiprocessing.connection.Connection): connection to the client
+        error (Exception): the error
+    """
+    try:
+        try:
+            conn.send(error)
+        except OSError:
+            raise
+        except Exception:
+            conn.send(RuntimeError(f"{type(error).__name__}: {error}"))
+    except OSError:
+        # client disconnected while waiting
+        pass
+
+
+class RemotePredictor:
+    """This class is the client side of the inference service, with the same interface as the
+    other predictors in inference.py. Each RemotePredictor has its own connection.
+    """
+
+    def __init__(self, path, address=SOCKET_PATH):
+        """Creates a RemotePredictor object.
+
+        Args:
+            path (str): path of the trained model, as seen by the service
+            address (str, optional): path of the unix socket the service listens on. Defaults to SOCKET_PATH.
+
+        Raises:
+            Exception: The error raised by the service when loading the model.
+        """
+        self.model = None
+        self.path = path
+        self.conn = Client(address, family='AF_UNIX', authkey=AUTHKEY)
+        self.lock = threading.Lock()
+        self.conn.send((path, None))
+        reply = self.conn.recv()
+        if isinstance(reply, Exception):
+            self.conn.close()
+            raise reply
+        self.input_shape = reply
+
+    def predict(self, batch):
+        """Prediction vectors for a batch of model inputs, computed by the service.
+
+        Args:
+            batch (ndarray): normalized model inputs, with the batch as the first dimension
+
+        Raises:
+            Exception: The error raised by the service when running the model.
+
+        Returns:
+            ndarray: 2D array, each row being the prediction vector of the corresponding input
+        """
+        with self.lock:
+            self.conn.send((self.path, np.asarray(batch, dtype=np.float32)))
+            reply = self.conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the shared inference service.')
+    parser.add_argument('--address', default=SOCKET_PATH, help='path of the unix socket')
+    parser.add_argument('--backend', default='fast', help='inference backend the models are run with')
+    parser.add_argument('--window-ms', type=float, default=BATCH_WINDOW_SECS * 1000, help='batching window')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='maximum samples per batch')
+    parser.add_argument('--preload', nargs='*', default=[], help='model paths to load before serving')
+    args = parser.parse_args()
+
+    server = InferenceServer(args.address, args.backend, args.window_ms / 1000, args.max_batch)
+    for path in args.preload:
+        server.predictor(path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down")
+        print(f"{server.samples_count} samples in {server.batches_count} batches")
+
+
+if __name__ == '__main__':
+    main()
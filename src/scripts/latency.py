@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+
+import csv
+import json
+import threading
+import time
+import numpy as np
+
+
+class LatencyRecorder:
+    """This class records the latency of each stage of the perception / driving pipeline.
+
+    Each (stage, driver state) pair has its own fixed-size ring buffer, so recording costs a
+    couple of array writes and the memory used does not grow with the length of the run.
+    """
+
+    def __init__(self, capacity=2048):
+        """Creates a LatencyRecorder object.
+
+        Args:
+            capacity (int, optional): number of latest samples kept per stage and state. Defaults to 2048.
+        """
+        self.capacity = capacity
+        """(stage, state) -> [ring buffer of latencies in ms, number of samples recorded]"""
+        self.buffers = {}
+        """current state of the driver, samples are recorded under it"""
+        self.state = "init"
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        """Context manager recording the time spent in its block as one sample of a stage.
+
+        Args:
+            name (str): name of the stage
+        """
+        return _Stage(self, name)
+
+    def record(self, name, secs, state=None):
+        """Records one sample of a stage.
+
+        Args:
+            name (str): name of the stage
+            secs (float): time spent in the stage, in seconds
+            state (str, optional): driver state the sample belongs to. Defaults to the current state.
+        """
+        key = (name, self.state if state is None else state)
+        with self.lock:
+            if key not in self.buffers:
+                self.buffers[key] = [np.zeros(self.capacity), 0]
+            buf = self.buffers[key]
+            buf[0][buf[1] % self.capacity] = secs * 1000
+            buf[1] += 1
+
+    def stats(self):
+        """Latency percentiles of each stage and state, over the samples currently kept.
+
+        Returns:
+            list[dict]: one dict per (stage, state), with the stage, state, count (samples recorded in total) and
+                the p50, p95, p99 and max latencies in ms
+        """
+        with self.lock:
+            buffers = [(key, buf[0][:min(buf[1], self.capacity)].copy(), buf[1]) for key, buf in self.buffers.items()]
+        rows = []
+        for (stage, state), samples, count in sorted(buffers):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            rows.append({"stage": stage, "state": state, "count": count,
+                         "p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3), "max": round(np.max(samples), 3)})
+        return rows
+
+    def to_json(self):
+        """Returns:
+            str: the stats as a json string (e.g. to be published on a ros topic)
+        """
+        return json.dumps(self.stats())
+
+    def to_csv(self, path):
+        """Writes the stats to a csv file.
+
+        Args:
+            path (str): path of the csv file
+        """
+        rows = self.stats()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["stage", "state", "count", "p50", "p95", "p99", "max"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class _Stage:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+"""process-wide recorder shared by the driver, the plate reader and the character readers"""
+LATENCY = LatencyRecorder()
@@ -1,7 +1,6 @@
-import tensorflow as tf
-from tensorflow.keras import models
 import numpy as np
-from PIL import Image
+
+from inference import load_predictor
 
 class Model:
     """This class is responsble for handling trained models.
@@ -11,13 +10,15 @@ class Model:
     if the image has been saved as 2D. Resaving an image that has been opened with cv2 will expand the image dimensions, even if it
     is loaded again with PIL
     """
-    def __init__(self, path) -> None:
+    def __init__(self, path, backend="keras") -> None:
         """Creates a Model object, representing a trained cnn that can be used.
 
         Args:
             path (str): path where the trained model is saved. 
+            backend (str, optional): inference backend to run the model with (see inference.BACKENDS). Defaults to "keras".
         """         
-        self.mod = models.load_model(path)
+        self.predictor = load_predictor(path, backend)
+        self.mod = self.predictor.model
         print(type(self.mod))
     
     @staticmethod
@@ -43,5 +44,5 @@ class Model:
             np.array: A 1-D array containing the model's predictions
         """        
         img = Model.preprcocess_img(img)
-        pred = self.mod.predict(img)[0]
+        pred = self.predictor.predict(img)[0]
         return pred
\ No newline at end of file
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext
+
+"""
+Motion detection from frame differences, for the states where the robot waits for something to move past
+it (the pedestrian at the crosswalk, the truck at the intersection).
+"""
+
+MOVING = "moving"
+STILL = "still"
+
+
+class MotionDetector:
+    """This class tells whether a region of the view is moving or still.
+
+    Each frame, the region is cropped, downsampled and converted to grayscale (uint8), and its mean squared
+    difference to the previous frame is computed on the integer absolute difference. The mean over a rolling
+    window of the latest differences is compared to two thresholds, with hysteresis: the region becomes moving
+    above the moving threshold, and still again only below the still threshold.
+
+    Downsampling and averaging lower the score compared to the full resolution mse of the last two frames
+    (to about 70-90% of it for an object moving a few pixels per frame at step=4, window=3, less for slower
+    motion), so thresholds tuned at full resolution must be rescaled, and checked with check_motion.py.
+    """
+
+    def __init__(self, crop, moving_thres, still_thres, step=4, window=3):
+        """Creates a MotionDetector object.
+
+        Args:
+            crop (tuple(int, int, int, int)): row_start, row_end, col_start, col_end of the region in the frame
+            moving_thres (float): mean squared difference above which the region is moving
+            still_thres (float): mean squared difference below which the region is still
+            step (int, optional): downsampling factor of the region, in both directions. Defaults to 4.
+            window (int, optional): number of latest differences averaged. Defaults to 3.
+        """
+        self.crop = crop
+        self.moving_thres = moving_thres
+        self.still_thres = still_thres
+        self.step = step
+        """ring buffer of the latest differences"""
+        self.diffs = np.zeros(window)
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous frames, e.g. when the robot starts waiting again."""
+        self.prev = None
+        self.num_diffs = 0
+        self.state = None
+        self.last_diff = -1
+
+    def region(self, img):
+        """Cropped (and downsampled if step > 1) grayscale view of the region.
+
+        Args:
+            img (cv::Mat or FrameContext): raw image data
+
+        Returns:
+            cv::Mat: the uint8 grayscale region
+        """
+        frame = FrameContext.of(img)
+        r0, r1, c0, c1 = self.crop
+        crped = frame.img[r0:r1, c0:c1]
+        if self.step > 1:
+            crped = cv2.resize(crped, ((c1 - c0) // self.step, (r1 - r0) // self.step), interpolation=cv2.INTER_AREA)
+        code = cv2.COLOR_RGB2GRAY if frame.type == "rgb" else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(crped, code)
+
+    @property
+    def score(self):
+        """float: mean of the differences in the window, -1 before the first difference"""
+        n = min(self.num_diffs, len(self.diffs))
+        return float(self.diffs[:n].mean()) if n else -1
+
+    def update(self, img):
+        """Adds a frame.
+
+        Args:
+            img (cv::Mat or FrameContext): raw image data
+
+        Returns:
+            str: MOVING or STILL when the state of the region changes on this frame, None otherwise
+        """
+        gray = self.region(img)
+        prev, self.prev = self.prev, gray
+        if prev is None:
+            return None
+        diff = cv2.absdiff(prev, gray)
+        self.last_diff = cv2.norm(diff, cv2.NORM_L2SQR) / diff.size
+        self.diffs[self.num_diffs % len(self.diffs)] = self.last_diff
+        self.num_diffs += 1
+
+        score = self.score
+        state = self.state
+        if score > self.moving_thres:
+            state = MOVING
+        elif score < self.still_thres:
+            state = STILL
+        if state == self.state:
+            return None
+        self.state = state
+        return state
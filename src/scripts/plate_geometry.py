@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+
+import functools
+import cv2
+import numpy as np
+
+"""
+Geometry of the license plates in the camera frames, shared by PlateReader and PlatePull: corners of the
+plate contour, their ordering, the rejection of plates cut by the border of the frame and the perspective
+transform to the rectangular plate view.
+"""
+
+CAR_WIDTH = 200
+CAR_HEIGHT = 320
+
+
+@functools.lru_cache(maxsize=None)
+def destination_quad(width=CAR_WIDTH, height=CAR_HEIGHT):
+    """Corners of the plate view, in the order of order_corners (computed once per size).
+
+    Args:
+        width (int, optional): width of the plate view. Defaults to CAR_WIDTH.
+        height (int, optional): height of the plate view. Defaults to CAR_HEIGHT.
+
+    Returns:
+        ndarray: tl, tr, bl, br as [col, row], shape (4, 2) float32
+    """
+    return np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+
+
+def corners(approx_c):
+    """Verticies of an approximated contour.
+
+    Args:
+        approx_c (ndarray): approximated contour (see approximate)
+
+    Returns:
+        ndarray: verticies as [col, row], shape (n, 2) float32
+    """
+    return np.asarray(approx_c, dtype=np.float32).reshape(-1, 2)
+
+
+def approximate(contour, epsilon=0.1):
+    """Approximates a contour to a simple shape such as a square, rectangle, etc.
+
+    Args:
+        contour (ndarray): contour to be approximated
+        epsilon (float in (0,1), optional): approximation accuracy, relative to the perimeter. Defaults to 0.1.
+
+    Returns:
+        ndarray: the approximated contour
+    """
+    return cv2.approxPolyDP(contour, epsilon*cv2.arcLength(contour, True), True)
+
+
+def order_corners(pts):
+    """Picks the top left, top right, bottom left and bottom right corners of a quadrilateral, as the
+    verticies with the min / max of col + row and row - col (so extra verticies on the sides are ignored).
+
+    Args:
+        pts (ndarray): verticies as [col, row], shape (n, 2)
+
+    Returns:
+        ndarray: tl, tr, bl, br, shape (4, 2) float32. None if there are less than 4 distinct corners.
+    """
+    pts = np.asarray(pts, dtype=np.float32).reshape(-1, 2)
+    if len(pts) < 4:
+        return None
+    s = pts.sum(axis=1)
+    d = pts[:, 1] - pts[:, 0]
+    idx = [np.argmin(s), np.argmin(d), np.argmax(d), np.argmax(s)]
+    if len(set(idx)) < 4:
+        return None
+    return pts[idx]
+
+
+def touches_border(pts, shape):
+    """Checks if any of the verticies lies on the border of the frame (i.e. the plate is cut).
+
+    Args:
+        pts (ndarray): verticies as [col, row], shape (n, 2)
+        shape (tuple): shape of the frame
+
+    Returns:
+        bool: True if a vertex is on the border
+    """
+    rows, cols = shape[:2]
+    return bool(np.any((pts <= 0) | (pts >= (cols - 1, rows - 1))))
+
+
+def plate_quad(contour, shape, epsilon=0.1):
+    """Corners of the plate outlined by a contour.
+
+    Args:
+        contour (ndarray): contour of the plate
+        shape (tuple): shape of the frame
+        epsilon (float in (0,1), optional): approximation accuracy of the contour. Defaults to 0.1.
+
+    Returns:
+        ndarray: tl, tr, bl, br, shape (4, 2) float32. None if not a quadrilateral, or cut by the border.
+    """
+    quad = order_corners(corners(approximate(contour, epsilon)))
+    if quad is None or touches_border(quad, shape):
+        return None
+    return quad
+
+
+def warp_plate(image, quad, width=CAR_WIDTH, height=CAR_HEIGHT):
+    """Projects the plate to a rectangular view.
+
+    Args:
+        image (cv::Mat): the frame
+        quad (ndarray): tl, tr, bl, br corners of the plate in the frame
+        width (int, optional): width of the plate view. Defaults to CAR_WIDTH.
+        height (int, optional): height of the plate view. Defaults to CAR_HEIGHT.
+
+    Returns:
+        cv::Mat: the plate view
+    """
+    M = cv2.getPerspectiveTransform(np.float32(quad), destination_quad(width, height))
+    return cv2.warpPerspective(image, M, (width, height))
+
+
+def cell_transforms(quad, cells, size, width=CAR_WIDTH, height=CAR_HEIGHT):
+    """Perspective transforms from the frame straight to cells of the plate view (e.g. each character),
+    each cell being scaled to size, so that no intermediate plate view has to be warped and resized.
+
+    Args:
+        quad (ndarray): tl, tr, bl, br corners of the plate in the frame
+        cells (list[tuple]): col_start, row_start, col_end, row_end of each cell in the plate view
+        size (tuple(int, int)): width, height of the cell images
+        width (int, optional): width of the plate view the cells are in. Defaults to CAR_WIDTH.
+        height (int, optional): height of the plate view the cells are in. Defaults to CAR_HEIGHT.
+
+    Returns:
+        ndarray: one 3x3 transform per cell, shape (n, 3, 3)
+    """
+    H = cv2.getPerspectiveTransform(np.float32(quad), destination_quad(width, height))
+    cells = np.asarray(cells, dtype=np.float64).reshape(-1, 4)
+    # plate view coords of the cell pixels, with pixel centers aligned as cv2.resize does
+    sx = (cells[:, 2] - cells[:, 0]) / size[0]
+    sy = (cells[:, 3] - cells[:, 1]) / size[1]
+    tx = cells[:, 0] + 0.5*sx - 0.5
+    ty = cells[:, 1] + 0.5*sy - 0.5
+    to_cell = np.zeros((len(cells), 3, 3))
+    to_cell[:, 0, 0] = 1 / sx
+    to_cell[:, 0, 2] = -tx / sx
+    to_cell[:, 1, 1] = 1 / sy
+    to_cell[:, 1, 2] = -ty / sy
+    to_cell[:, 2, 2] = 1
+    return to_cell @ H
+
+
+def warp_cells(image, quad, cells, size, width=CAR_WIDTH, height=CAR_HEIGHT):
+    """Warps cells of the plate straight from the frame (see cell_transforms).
+
+    Args:
+        image (cv::Mat): the frame
+        quad (ndarray): tl, tr, bl, br corners of the plate in the frame
+        cells (list[tuple]): col_start, row_start, col_end, row_end of each cell in the plate view
+        size (tuple(int, int)): width, height of the cell images
+        width (int, optional): width of the plate view the cells are in. Defaults to CAR_WIDTH.
+        height (int, optional): height of the plate view the cells are in. Defaults to CAR_HEIGHT.
+
+    Returns:
+        list[cv::Mat]: the image of each cell
+    """
+    return [cv2.warpPerspective(image, M, size) for M in cell_transforms(quad, cells, size, width, height)]
@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+
+import threading
+import numpy as np
+
+from char_reader import CharReader
+from contour_stats import top_k_indices
+
+
+class PlatePassBuffer:
+    """This class collects the views of the plates seen during one pass past the parked cars, so that they
+    are read all at once when the pass ends instead of frame by frame.
+
+    The model inputs of each view (the ID and the 4 character cells, see PlateReader.get_cell_imgs) are
+    written to preallocated arrays used as a ring buffer, so the memory used is fixed: when full, the
+    oldest views are overwritten.
+    """
+
+    def __init__(self, capacity=64):
+        """Creates a PlatePassBuffer object.
+
+        Args:
+            capacity (int, optional): max number of views kept. Defaults to 64.
+        """
+        self.capacity = capacity
+        id_w, id_h = CharReader.ID_SIZE
+        char_w, char_h = CharReader.CHAR_SIZE
+        self.id_imgs = np.zeros((capacity, id_h, id_w), dtype=np.uint8)
+        self.char_imgs = np.zeros((capacity, 4, char_h, char_w), dtype=np.uint8)
+        self.qualities = np.zeros(capacity)
+        self.track_ids = np.zeros(capacity, dtype=np.int64)
+        """number of views added since the last clear (may exceed the capacity)"""
+        self.count = 0
+        self.lock = threading.Lock()
+        """stats"""
+        self.passes_count = 0
+        self.views_count = 0
+        self.overwritten_count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, id_img, char_imgs, quality, track_id):
+        """Adds the view of a plate.
+
+        Args:
+            id_img (cv::Mat): model input of the ID
+            char_imgs (list[cv::Mat]): model inputs of the 4 characters
+            quality (float): quality score of the view
+            track_id (int): track ID of the plate
+        """
+        with self.lock:
+            i = self.count % self.capacity
+            if self.count >= self.capacity:
+                self.overwritten_count += 1
+            self.id_imgs[i] = id_img
+            self.char_imgs[i] = char_imgs
+            self.qualities[i] = quality
+            self.track_ids[i] = track_id
+            self.count += 1
+            self.views_count += 1
+
+    def take_best(self, k):
+        """Takes the best k views of each plate by quality, and empties the buffer for the next pass.
+
+        Args:
+            k (int): max number of views per plate (track)
+
+        Returns:
+            tuple(list, list, list): the cells (ID image, character images) of each view, their track IDs and quality
+        """
+        with self.lock:
+            n = len(self)
+            cells, track_ids, qualities = [], [], []
+            for track_id in np.unique(self.track_ids[:n]):
+                views = np.flatnonzero(self.track_ids[:n] == track_id)
+                for i in views[top_k_indices(self.qualities[views], k)]:
+                    cells.append((self.id_imgs[i].copy(), list(self.char_imgs[i].copy())))
+                    track_ids.append(int(track_id))
+                    qualities.append(float(self.qualities[i]))
+            if n:
+                self.passes_count += 1
+            self.count = 0
+            return cells, track_ids, qualities
+
+    def report(self):
+        """Summary of the passes and views collected.
+
+        Returns:
+            str: the summary
+        """
+        with self.lock:
+            return (f"plate passes {self.passes_count}, views collected {self.views_count}, "
+                    f"overwritten {self.overwritten_count}, pending {len(self)}")
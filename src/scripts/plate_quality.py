@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext
+
+"""
+Quality of the view of a license plate, to skip the views not worth reading (motion blurred, far away or
+seen at a sharp angle) and to weigh the readings of the others.
+"""
+
+
+class PlateQuality:
+    """This class holds the quality of the view of one plate.
+    """
+
+    def __init__(self, score=0.0, sharpness=0.0, area=0.0, skew=1.0):
+        """Creates a PlateQuality object.
+
+        Args:
+            score (float): overall quality, from 0 (worst) to 1 (best)
+            sharpness (float): variance of the Laplacian of the plate region
+            area (float): apparent area of the plate in pixels
+            skew (float): from 0 (seen straight on) to 1 (rotated by 45 degrees, or one side twice as high as the other)
+        """
+        self.score = score
+        self.sharpness = sharpness
+        self.area = area
+        self.skew = skew
+
+
+def quad_area(quad):
+    """Area of a plate from its tl, tr, bl, br corners (shoelace formula).
+
+    Args:
+        quad (ndarray): tl, tr, bl, br corners, shape (4, 2)
+
+    Returns:
+        float: the area in pixels
+    """
+    x, y = np.asarray(quad, dtype=np.float64)[[0, 1, 3, 2]].T
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def quad_skew(quad):
+    """How far a plate is from being seen straight on, from its tl, tr, bl, br corners: the larger of the angle of
+    its top edge (relative to 45 degrees) and of the difference in height of its sides (relative to the higher one).
+
+    Args:
+        quad (ndarray): tl, tr, bl, br corners, shape (4, 2)
+
+    Returns:
+        float: the skew, from 0 to 1
+    """
+    tl, tr, bl, br = np.asarray(quad, dtype=np.float64)
+    top = tr - tl
+    angle = abs(np.arctan2(top[1], top[0])) / (np.pi/4)
+    left, right = np.linalg.norm(bl - tl), np.linalg.norm(br - tr)
+    ratio = 1 - min(left, right) / max(left, right) if max(left, right) else 1
+    return float(min(1.0, max(angle, 2*ratio)))
+
+
+def sharpness(gray):
+    """Variance of the Laplacian of a grayscale image (low when blurry).
+
+    Args:
+        gray (cv::Mat): grayscale image
+
+    Returns:
+        float: the variance
+    """
+    mean, std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_16S))
+    return float(std[0][0] ** 2)
+
+
+class PlateQualityScorer:
+    """This class scores the view of a plate from its sharpness, apparent size and skew.
+    """
+
+    def __init__(self, sharpness_ref=100.0, area_ref=25000.0, min_score=0.2):
+        """Creates a PlateQualityScorer object.
+
+        Args:
+            sharpness_ref (float, optional): sharpness above which a plate is considered sharp. Defaults to 100.
+            area_ref (float, optional): area (in pixels) above which a plate is considered close. Defaults to 25000.
+            min_score (float, optional): score below which a view is not worth reading. Defaults to 0.2.
+
+        Raises:
+            ValueError: if min_score is not positive: the score of a view is the weight of its reading
+                (see Driver.update_prediction), readings of weight 0 cannot be averaged.
+        """
+        if min_score <= 0:
+            raise ValueError(f"min_score must be positive, got {min_score}")
+        self.sharpness_ref = sharpness_ref
+        self.area_ref = area_ref
+        self.min_score = min_score
+
+    def score(self, img, quad):
+        """Scores the view of a plate.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing the plate
+            quad (ndarray): tl, tr, bl, br corners of the plate in the image
+
+        Returns:
+            PlateQuality: the score, and what it was computed from
+        """
+        frame = FrameContext.of(img)
+        x, y, w, h = cv2.boundingRect(np.float32(quad))
+        crop = frame.img[y:y + h, x:x + w]
+        code = cv2.COLOR_RGB2GRAY if frame.type == "rgb" else cv2.COLOR_BGR2GRAY
+        sharp = sharpness(cv2.cvtColor(crop, code))
+        area = quad_area(quad)
+        skew = quad_skew(quad)
+        score = min(1.0, sharp / self.sharpness_ref) * min(1.0, area / self.area_ref) * (1 - skew)
+        return PlateQuality(score, sharp, area, skew)
+
+    def is_readable(self, quality):
+        """Returns:
+            bool: True if the view of the plate is worth reading
+        """
+        return quality.score >= self.min_score
@@ -1,7 +1,6 @@
 #! /usr/bin/env python3
 
 from __future__ import print_function
-from concurrent.futures import process
 
 #import roslib; roslib.load_manifest('node')
 import sys
@@ -12,12 +11,17 @@ import numpy as np
 from sensor_msgs.msg import Image
 from cv_bridge import CvBridge, CvBridgeError
 from char_reader import CharReader
-from hsv_view import ImageProcessor
+from frame_context import FrameContext
+from latency import LATENCY
+from contour_stats import top_contours
+from plate_tracker import PlateTracker
+from gating import GATES
+from plate_quality import PlateQualityScorer
+import plate_geometry
+from plate_geometry import CAR_WIDTH
 
 # license plate working values
 
-CAR_WIDTH = 200
-CAR_HEIGHT = 320
 PLATE_F = 270
 PLATE_I = 220
 PLATE_RES = (150, 298)
@@ -25,6 +29,11 @@ ID_TOP = 130
 ID_BOT = 185
 ID_LEFT = 110
 ID_RIGHT = 190
+"""cells of the characters and of the ID in the plate view, (col_start, row_start, col_end, row_end)"""
+CHAR_CELLS = [(int(pos*CAR_WIDTH/4), PLATE_I, int((pos + 1)*CAR_WIDTH/4), PLATE_F) for pos in range(4)]
+ID_CELL = (ID_LEFT, ID_TOP, ID_RIGHT, ID_BOT)
+"""warp each character straight from the frame to the model input, instead of going through the plate view"""
+DIRECT_WARP = True
 
 
 # PATH_NUM_MODEL = '/home/fizzer/ros_ws/src/ENPH353-Team12/src/models/num_model-1.1.1.h5'
@@ -32,28 +41,81 @@ ID_RIGHT = 190
 PATH_NUM_MODEL = '/home/fizzer/ros_ws/src/ENPH353-Team12/src/models/num_model2.h5'
 PATH_ALPHA_MODEL = '/home/fizzer/ros_ws/src/ENPH353-Team12/src/models/alpha_model2.1.h5'
 PATH_PARKING_ID = '/home/fizzer/ros_ws/src/ENPH353-Team12/src/models/id_model2.h5'
+READER_BACKEND = "fast"
 
 font = cv2.FONT_HERSHEY_COMPLEX
 font_size = 0.5
 
 AREA_LOWER_THRES = 10000
 AREA_UPPER_THRES = 1000000
+"""max number of plates read in one frame"""
+MAX_PLATES = 4
 
 ROWS = 720
 COLS = 1280
 
+class PlateReading:
+    """This class holds the result of reading one license plate view.
+    """
+
+    def __init__(self, id="", id_vec=[], license="", license_vecs=[], track_id=None, quality=1.0):
+        """Creates a PlateReading object.
+
+        Args:
+            id (str): predicted plate ID, empty string if no prediction
+            id_vec (array): 1D array of the predicted probabilities for the plate ID
+            license (str): predicted license plate characters, empty string if no prediction
+            license_vecs (ndarray): 2D array of length 4, each element being the predicted probabilities of the corresponding character
+            track_id (int): ID of the track of the physical plate read (see PlateTracker), None if not tracked
+            quality (float): quality score of the view of the plate, from 0 to 1 (see PlateQualityScorer)
+        """
+        self.id = id
+        self.id_vec = id_vec
+        self.license = license
+        self.license_vecs = license_vecs
+        self.track_id = track_id
+        self.quality = quality
+
+    def __bool__(self):
+        return bool(self.id) and bool(self.license)
+
+
 class PlateReader:
     """This class handles license plate recognition.
     """
 
-    def __init__(self, script_run=True):
+    def __init__(self, script_run=True, readers=None):
+        """Creates a PlateReader object.
+
+        Args:
+            script_run (bool, optional): True if ran as its own node, subscribing to the camera. Defaults to True.
+            readers (dict[str, CharReader], optional): already loaded character readers, keyed as in
+                PlateReader.reader_loaders. Defaults to None (loaded here).
+        """
         self.bridge = CvBridge()
+        if readers is None:
+            readers = {name: loader() for name, loader in PlateReader.reader_loaders().items()}
+        self.num_reader = readers["num"]
+        self.alpha_reader = readers["alpha"]
+        self.id_reader = readers["id"]
+        self.tracker = PlateTracker(self.get_plate_quads, AREA_LOWER_THRES, AREA_UPPER_THRES)
+        self.scorer = PlateQualityScorer()
+        self.i = 0
         if script_run:
             self.image_sub = rospy.Subscriber("/R1/pi_camera/image_raw", Image, self.callback)
-        self.num_reader = CharReader(PATH_NUM_MODEL)
-        self.alpha_reader = CharReader(PATH_ALPHA_MODEL)
-        self.id_reader = CharReader(PATH_PARKING_ID)
-        self.i = 0
+
+    @staticmethod
+    def reader_loaders():
+        """Functions loading each of the character readers, so that they can be loaded concurrently (see startup.load_parallel).
+
+        Returns:
+            dict[str, callable]: reader name -> function creating the CharReader
+        """
+        return {
+            "num": lambda: CharReader(PATH_NUM_MODEL, READER_BACKEND),
+            "alpha": lambda: CharReader(PATH_ALPHA_MODEL, READER_BACKEND),
+            "id": lambda: CharReader(PATH_PARKING_ID, READER_BACKEND),
+        }
 
     def get_moments(self, img, debug=False):
         """Returns the moment (contour) of an image: c, cx, cy. 
@@ -69,18 +131,14 @@ class PlateReader:
             list[float]: a list of the largest contours
         """
         
-        contours, hierarchy = cv2.findContours(
-            image=img, mode=cv2.RETR_TREE, method=cv2.CHAIN_APPROX_NONE)
-
         # gets the biggest contour and its info
-        if not contours:
+        stats = top_contours(img)
+        if not stats:
             return []
-        c = max(contours, key=cv2.contourArea)
-        M = cv2.moments(c)
-        cx = int(M['m10']/M['m00'])
-        cy = int(M['m01']/M['m00'])
+        c = stats.largest
 
         if debug:
+            cx, cy = stats.centroid()
             return c, cx, cy
 
         return c
@@ -96,6 +154,7 @@ class PlateReader:
         except CvBridgeError as e:
             print(e)
 
+        cv_image = FrameContext(cv_image)
         p_v = self.get_plate_view(cv_image)
 
         if list(p_v):
@@ -115,7 +174,7 @@ class PlateReader:
         """Obtains the cnn's prediction data of a license plate.
 
         Args:
-            img (cv::Mat): Raw image data containing a license plate to predict on
+            img (cv::Mat or FrameContext): Raw image data containing a license plate to predict on
 
         Returns:
             tuple[str, ndarray]: string of characters representing the predicted license plate, and a 2D array of length 4, each element being an array containing the predicted probablities 
@@ -123,9 +182,7 @@ class PlateReader:
         """        
         p_v = self.get_plate_view(img)
         if list(p_v):
-            c_img = self.get_char_imgs(p_v)
-            pred, pred_vecs = self.characters(c_img, get_pred_vec=True)
-            return pred, pred_vecs
+            return self.read_license(p_v)
         else:
             return "", []
 
@@ -133,7 +190,7 @@ class PlateReader:
         """Obtains the cnn's prediction data of a plate ID.
 
         Args:
-            img (cv::Mat): Raw image data containing a license plate to predict on
+            img (cv::Mat or FrameContext): Raw image data containing a license plate to predict on
 
         Returns:
             tuple[str, array]: Number of the license plate ID and a 1D array containing the predicted probablities 
@@ -141,66 +198,251 @@ class PlateReader:
         """        
         p_v = self.get_plate_view(img)
         if list(p_v):
-            id_img = self.plate_id_img(p_v)
-            pred_vec = self.id_reader.predict_char(id_img, id=True)
-            chr_out = self.id_reader.interpret(pred_vec)
-            return chr_out, pred_vec
+            return self.read_id(p_v)
         else:
             return "", []
 
+    def read_plate(self, img):
+        """Obtains the cnn's prediction data of both the plate ID and the license plate of the first plate 
+        in view (see read_plates).
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing a license plate to predict on
+
+        Returns:
+            PlateReading: the predictions for the plate. Empty (i.e. falsy) if the image is invalid.
+        """
+        readings = self.read_plates(img)
+        return readings[0] if readings else PlateReading()
+
+    def read_plates(self, img):
+        """Obtains the cnn's prediction data of both the plate ID and the license plate of every plate in view,
+        detecting and projecting each plate only once. The plates are read together, with one call per model.
+
+        The plates are tracked from the previous frames (see PlateTracker), so consecutive frames are meant to be
+        read in order. The license plate characters are only predicted when a plate ID has been predicted.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing license plates to predict on
+
+        Returns:
+            list[PlateReading]: the predictions for each plate found, largest first when first detected
+        """
+        frame = FrameContext.of(img)
+        located = self.locate_plates(frame)
+        if not located:
+            return []
+        if not DIRECT_WARP:
+            readings = [PlateReading(track_id=track_id, quality=score) for track_id, quad, score in located]
+            for reading, (track_id, quad, score) in zip(readings, located):
+                p_v = plate_geometry.warp_plate(frame.img, quad)
+                reading.id, reading.id_vec = self.read_id(p_v)
+                if reading.id:
+                    reading.license, reading.license_vecs = self.read_license(p_v)
+            return readings
+
+        with LATENCY.stage("warp cells"):
+            cells = [self.get_cell_imgs(frame, quad) for track_id, quad, score in located]
+        return self.read_cells(cells, [track_id for track_id, quad, score in located], [score for track_id, quad, score in located])
+
+    def locate_plates(self, img):
+        """Finds the plates worth reading in a frame, through the gating cascade: a plate sized contour (unless 
+        plates are already tracked), a valid quad, then the quality of the view. No cnn is run.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing license plates
+
+        Returns:
+            list[tuple(int, ndarray, float)]: track ID, corners and quality score of each plate worth reading
+        """
+        frame = FrameContext.of(img)
+        with LATENCY.stage("get_plate_quad"):
+            if not GATES.check("plate contour", self.tracker.tracks or self.has_plate_contour(frame)):
+                return []
+            tracked = self.tracker.update(frame)
+        if not GATES.check("plate quad", tracked):
+            return []
+        # blurry, far or skewed views are not read
+        with LATENCY.stage("plate quality"):
+            scored = [(track_id, quad, self.scorer.score(frame, quad)) for track_id, quad in tracked]
+            located = [(track_id, quad, q.score) for track_id, quad, q in scored if self.scorer.is_readable(q)]
+        GATES.check("plate quality", located)
+        return located
+
+    def read_cells(self, cells, track_ids, qualities):
+        """Predicts the plate ID and license plate of several plates from the model inputs of their cells,
+        with one call to the ID model, then one call to each of the letter and number models.
+
+        Args:
+            cells (list[tuple[cv::Mat, list[cv::Mat]]]): the ID image and the 4 character images of each plate (see get_cell_imgs)
+            track_ids (list[int]): track ID of each plate
+            qualities (list[float]): quality score of the view of each plate
+
+        Returns:
+            list[PlateReading]: the predictions for each plate
+        """
+        readings = [PlateReading(track_id=track_id, quality=score) for track_id, score in zip(track_ids, qualities)]
+        if not readings:
+            return []
+        id_vecs = self.id_reader.predict_batch([id_img for id_img, char_imgs in cells], id=True, preprocessed=True)
+        for reading, id_vec in zip(readings, id_vecs):
+            reading.id_vec = id_vec
+            reading.id = self.id_reader.interpret(id_vec)
+        with_id = [i for i, reading in enumerate(readings) if reading.id]
+        if with_id:
+            licenses = self.characters_batch([cells[i][1] for i in with_id], preprocessed=True)
+            for i, (license, license_vecs) in zip(with_id, licenses):
+                readings[i].license, readings[i].license_vecs = license, license_vecs
+        return readings
+
+    def read_id(self, plate_view):
+        """Predicts the plate ID from a projected view of the license plate.
+
+        Args:
+            plate_view (cv::Mat): Projected view of the license plate (see get_plate_view)
+
+        Returns:
+            tuple[str, array]: Number of the license plate ID and a 1D array containing the predicted probablities
+        """
+        id_img = self.plate_id_img(plate_view)
+        pred_vec = self.id_reader.predict_char(id_img, id=True)
+        chr_out = self.id_reader.interpret(pred_vec)
+        return chr_out, pred_vec
+
+    def read_license(self, plate_view):
+        """Predicts the license plate characters from a projected view of the license plate.
+
+        Args:
+            plate_view (cv::Mat): Projected view of the license plate (see get_plate_view)
+
+        Returns:
+            tuple[str, ndarray]: string of characters representing the predicted license plate, and a 2D array of length 4 with the predicted probabilities of each character
+        """
+        c_img = self.get_char_imgs(plate_view)
+        return self.characters(c_img, get_pred_vec=True)
+
     def get_plate_view(self, img):
         """Obtains the projected rectangular view of a license plate contained within the input image.
 
         Args:
-            img (cv::Mat): Raw image data containing the license plate.
+            img (cv::Mat or FrameContext): Raw image data containing the license plate.
 
         Returns:
             cv::Mat: Projected view of the license plate, or empty list if invalid image.
         """        
-        processed_im = ImageProcessor.filter_plate(img, ImageProcessor.plate_low, ImageProcessor.plate_up)
-        c = self.get_moments(processed_im)
-        if not list(c):
-            # no contour
-            return []
-        area = cv2.contourArea(c)
-        if area < AREA_LOWER_THRES or area > AREA_UPPER_THRES:
-            return []
-        approx = self.approximate_plate(c, epsilon=0.1)
-        verticies = self.verticies(approx_c=approx)
-        
-        if not list(verticies):
-            # no verticies (i.e. no perspec. transform)
+        frame = FrameContext.of(img)
+        quad = self.get_plate_quad(frame)
+        if quad is None:
             return []
-        plate_view = self.transform_perspective(CAR_WIDTH, CAR_HEIGHT, verticies, img)
-        return plate_view
+        return plate_geometry.warp_plate(frame.img, quad)
+
+    def get_plate_quad(self, img):
+        """Obtains the corners of the largest license plate contained within the input image.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing the license plate.
+
+        Returns:
+            ndarray: tl, tr, bl, br corners of the plate in the image, or None if invalid image.
+        """
+        quads = self.get_plate_quads(img, max_plates=1)
+        return quads[0] if quads else None
+
+    def has_plate_contour(self, img):
+        """Checks if the image contains a contour of the size of a license plate, without checking its shape.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data.
+
+        Returns:
+            bool: True if the largest plate contour is within the area thresholds
+        """
+        area = top_contours(FrameContext.of(img).mask("plate")).largest_area
+        return AREA_LOWER_THRES <= area <= AREA_UPPER_THRES
 
-    def characters(self, char_imgs, get_pred_vec=False):
+    def get_plate_quads(self, img, max_plates=MAX_PLATES):
+        """Obtains the corners of every license plate contained within the input image, i.e. of the largest
+        contours passing the area and shape checks.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing license plates.
+            max_plates (int, optional): max number of plates. Defaults to MAX_PLATES.
+
+        Returns:
+            list[ndarray]: tl, tr, bl, br corners of each plate in the image, largest first
+        """
+        frame = FrameContext.of(img)
+        stats = top_contours(frame.mask("plate"), max_plates)
+        quads = []
+        for c, area in zip(stats.contours, stats.areas):
+            if area < AREA_LOWER_THRES:
+                # sorted by area, the next ones are smaller
+                break
+            if area > AREA_UPPER_THRES:
+                continue
+            # None if no verticies (i.e. no perspec. transform)
+            quad = plate_geometry.plate_quad(c, frame.img.shape, epsilon=0.1)
+            if quad is not None:
+                quads.append(quad)
+        return quads
+
+    def get_cell_imgs(self, img, quad):
+        """Warps the ID and the characters of a plate straight from the image to the input of their models 
+        (grayscale, CharReader.ID_SIZE / CharReader.CHAR_SIZE), one perspective transform per cell.
+
+        Args:
+            img (cv::Mat or FrameContext): Raw image data containing the license plate.
+            quad (ndarray): corners of the plate (see get_plate_quad)
+
+        Returns:
+            tuple[cv::Mat, list[cv::Mat]]: the image of the ID, and the images of the 4 characters
+        """
+        frame = FrameContext.of(img)
+        code = cv2.COLOR_RGB2GRAY if frame.type == "rgb" else cv2.COLOR_BGR2GRAY
+        id_img = plate_geometry.warp_cells(frame.img, quad, [ID_CELL], CharReader.ID_SIZE)[0]
+        char_imgs = plate_geometry.warp_cells(frame.img, quad, CHAR_CELLS, CharReader.CHAR_SIZE)
+        return cv2.cvtColor(id_img, code), [cv2.cvtColor(c, code) for c in char_imgs]
+
+    def characters(self, char_imgs, get_pred_vec=False, preprocessed=False):
         """Gets the neural network predicted characters from the images of each character.
 
         Args:
             char_imgs (array[Image]): Array (length 4) of character images from the license plate.
                 First two images should be of letters, second two should be of numbers.
             get_pred_vec (bool, optional): True if prediction data should also be returned. Defaults to False.
+            preprocessed (bool, optional): True if the images are already the model inputs (see get_cell_imgs). Defaults to False.
         Returns:
             str or tuple[str,ndarray]: a string representing the license plate. Also returns the prediction probabilities for each character if set to true. 
         """
         
-        pred_vecs = []
-        license_plate = ''
-        for index,img in enumerate(char_imgs):
-            if index < 2:
-                prediction_vec = self.alpha_reader.predict_char(img=img)
-                license_plate += CharReader.interpret(predict_vec=prediction_vec)
-            else:
-                prediction_vec = self.num_reader.predict_char(img=img)
-                license_plate += CharReader.interpret(predict_vec=prediction_vec)
-            pred_vecs.append(np.round(np.array(prediction_vec), 3))
+        # one batch for the letters, one for the numbers
+        license_plate, pred_vecs = self.characters_batch([char_imgs], preprocessed)[0]
 
         if get_pred_vec:
-            return license_plate, np.array(pred_vecs)
+            return license_plate, pred_vecs
         else:
             return license_plate
 
+    def characters_batch(self, plates_char_imgs, preprocessed=False):
+        """Same as characters with get_pred_vec, for several plates at once: the letters of every plate are
+        predicted in one call to the model, and so are the numbers.
+
+        Args:
+            plates_char_imgs (list[array[Image]]): the 4 character images of each plate
+            preprocessed (bool, optional): True if the images are already the model inputs (see get_cell_imgs). Defaults to False.
+
+        Returns:
+            list[tuple[str, ndarray]]: the license plate and the prediction probabilities of each character, for each plate
+        """
+        alpha_vecs = self.alpha_reader.predict_batch([img for imgs in plates_char_imgs for img in imgs[:2]], preprocessed=preprocessed)
+        num_vecs = self.num_reader.predict_batch([img for imgs in plates_char_imgs for img in imgs[2:]], preprocessed=preprocessed)
+        results = []
+        for i in range(len(plates_char_imgs)):
+            prediction_vecs = list(alpha_vecs[2*i:2*i + 2]) + list(num_vecs[2*i:2*i + 2])
+            license_plate = ''.join(CharReader.interpret(predict_vec=vec) for vec in prediction_vecs)
+            results.append((license_plate, np.array([np.round(np.array(vec), 3) for vec in prediction_vecs])))
+        return results
+
     def get_char_imgs(self, plate):
         """Gets the verticies of a simple shape such as a square, rectangle, etc.
 
@@ -223,16 +465,8 @@ class PlateReader:
         Returns:
             ndarray: verticies of the contour, from top to bottom, left to right. Empty list returned if invalid verticies.
         """
-        n = approx_c.ravel()
-        pts = np.float32(self.get_coords(n)).reshape(-1, 2)
-        sorted_pts = PlateReader.contour_coords_sorted(pts)
-        if not list(sorted_pts):
-            return []
-
-        sorted_pts_np = np.array(sorted_pts)
-        if 0 in sorted_pts_np[:,0] or COLS-1 in sorted_pts_np[:,0]:
-            return []
-        if 0 in sorted_pts_np[:,1] or ROWS-1 in sorted_pts_np[:,1]:
+        sorted_pts = plate_geometry.order_corners(plate_geometry.corners(approx_c))
+        if sorted_pts is None or plate_geometry.touches_border(sorted_pts, (ROWS, COLS)):
             return []
         return sorted_pts
 
@@ -243,9 +477,7 @@ class PlateReader:
             contour (***): contour to be approximated
             epsilon (float in (0,1)): approximation accuracy
         """
-        perimeter = cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, epsilon*perimeter, True)
-        return approx
+        return plate_geometry.approximate(contour, epsilon)
 
     def process_plate(self, pos, plate_im):
         """Crops and processes plate images for individual letter.
@@ -281,24 +513,12 @@ class PlateReader:
         Returns: 
             The polygon from the original image transformed into a square
         """
-        pts = np.float32([[0, 0], [width, 0],
-                          [0, height], [width, height]])
-        Mat = cv2.getPerspectiveTransform(sorted_pts, pts)
-        return cv2.warpPerspective(image, Mat, (width, height))
+        return plate_geometry.warp_plate(image, sorted_pts, width, height)
 
     def get_coords(self, contour):
         """Args: Approximated contour extracted with CHAIN_APPROX_NONE (only the verticies)
            Returns: List of verticies in (x,y) coords"""
-        i = 0
-        coords = []
-        for j in contour:
-            if (i % 2 == 0):
-                x = contour[i]
-                y = contour[i + 1]
-                coords.append((x, y))
-            i += 1
-            
-        return coords
+        return plate_geometry.corners(contour)
 
     @staticmethod
     def contour_coords_sorted(list_of_points):
@@ -310,37 +530,10 @@ class PlateReader:
         Returns: 
             ndarray: Verticies in list sorted by top to bottom, left to right, with each verticies being an array with [col, row]
         """
-        avg_y = 0
-        avg_x = 0
-        for i in list_of_points:
-            avg_y += i[1]
-            avg_x += i[0]
-
-        avg_y = int(avg_y/4)
-        avg_x = int(avg_x/4)
-
-        tl = tr = bl = br = None
-
-        for i in list_of_points:
-            if (int(i[1]) < avg_y and int(i[0]) < avg_x):
-                tl = i
-            elif (int(i[1]) < avg_y):
-                tr = i
-            elif (int(i[0]) < avg_x):
-                bl = i
-            else:
-                br = i
-                
-        if tl is None or tr is None or bl is None or br is None:
+        sorted_pts = plate_geometry.order_corners(list_of_points)
+        if sorted_pts is None:
             return []
-
-        tl = list(tl)
-        tr = list(tr)
-        bl = list(bl)
-        br = list(br)
-
-        coords = [tl, tr, bl, br]
-        return np.float32(coords).reshape(-1, 2)
+        return sorted_pts
 
 def main(args):
     pr = PlateReader(script_run=True)
@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+
+import itertools
+import threading
+import numpy as np
+
+import plate_geometry
+from contour_stats import top_contours
+from frame_context import FrameContext
+
+
+class PlateTrack:
+    """This class holds one physical plate followed by a PlateTracker.
+    """
+
+    def __init__(self, id, quad):
+        """Creates a PlateTrack object.
+
+        Args:
+            id (int): track ID
+            quad (ndarray): last corners of the plate in the frame
+        """
+        self.id = id
+        self.quad = quad
+        self.lost_frames = 0
+
+
+class PlateTracker:
+    """This class follows the license plates in view from frame to frame.
+
+    The plate of a parked car only moves slightly between consecutive frames, so each plate is looked for in
+    a window around its last corners first (a contour search on the mask of the window only). The whole
+    frame is only searched when a plate is lost, or every few frames to find the plates coming into view.
+    Every detection of the same physical plate gets the same track ID, so that its readings can be grouped.
+    """
+
+    def __init__(self, detect, area_lower, area_upper, min_margin=40, margin_frac=0.5, max_lost=5, search_every=5):
+        """Creates a PlateTracker object.
+
+        Args:
+            detect (callable): full frame search, returns the corners of every plate in a FrameContext
+            area_lower (float): min area of a plate contour
+            area_upper (float): max area of a plate contour
+            min_margin (int, optional): min margin of the window around the last corners, in pixels. Defaults to 40.
+            margin_frac (float, optional): margin of the window, relative to the size of the plate. Defaults to 0.5.
+            max_lost (int, optional): number of frames without a plate before its track ends. Defaults to 5.
+            search_every (int, optional): the whole frame is searched at least once every this many frames. Defaults to 5.
+        """
+        self.detect = detect
+        self.area_lower = area_lower
+        self.area_upper = area_upper
+        self.min_margin = min_margin
+        self.margin_frac = margin_frac
+        self.max_lost = max_lost
+        self.search_every = search_every
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.frames_since_search = 0
+        """stats"""
+        self.tracked_count = 0
+        self.searched_count = 0
+
+    def window(self, quad, shape):
+        """Window around the corners of a plate.
+
+        Args:
+            quad (ndarray): corners of the plate
+            shape (tuple): shape of the frame
+
+        Returns:
+            tuple(int, int, int, int): row_start, row_end, col_start, col_end
+        """
+        (c0, r0), (c1, r1) = quad.min(axis=0), quad.max(axis=0)
+        margin = max(self.min_margin, self.margin_frac * max(c1 - c0, r1 - r0))
+        rows, cols = shape[:2]
+        return (max(0, int(r0 - margin)), min(rows, int(r1 + margin) + 1),
+                max(0, int(c0 - margin)), min(cols, int(c1 + margin) + 1))
+
+    def search_window(self, frame, quad):
+        """Looks for a plate in the window around its last corners.
+
+        Args:
+            frame (FrameContext): the frame
+            quad (ndarray): last corners of the plate
+
+        Returns:
+            ndarray: corners of the plate in the frame, None if not found within the window
+        """
+        r0, r1, c0, c1 = self.window(quad, frame.img.shape)
+        stats = top_contours(frame.mask_window("plate", r0, r1, c0, c1))
+        if not stats or not self.area_lower <= stats.largest_area <= self.area_upper:
+            return None
+        quad = plate_geometry.plate_quad(stats.largest + np.int32([c0, r0]), frame.img.shape)
+        if quad is None:
+            return None
+        # a plate cut by the window (but not by the frame) is not trusted, the frame is searched instead
+        if plate_geometry.touches_border(quad - np.float32([c0, r0]), (r1 - r0, c1 - c0)):
+            return None
+        return quad
+
+    def match(self, quad, tracks):
+        """Track whose window contains the center of the corners found by a full frame search.
+
+        Args:
+            quad (ndarray): corners of a plate
+            tracks (list[PlateTrack]): candidate tracks
+
+        Returns:
+            PlateTrack: the matching track, None if it is a new plate
+        """
+        cx, cy = quad.mean(axis=0)
+        for track in tracks:
+            r0, r1, c0, c1 = self.window(track.quad, (np.inf, np.inf))
+            if c0 <= cx < c1 and r0 <= cy < r1:
+                return track
+        return None
+
+    def update(self, img):
+        """Finds the plates in a new frame.
+
+        Args:
+            img (cv::Mat or FrameContext): raw image data
+
+        Returns:
+            list[tuple(int, ndarray)]: track ID and corners of each plate found in the frame
+        """
+        frame = FrameContext.of(img)
+        with self.lock:
+            found = {}
+            for track in self.tracks:
+                quad = self.search_window(frame, track.quad)
+                if quad is not None:
+                    found[track.id] = quad
+            self.tracked_count += len(found)
+            self.frames_since_search += 1
+            if len(found) < len(self.tracks) or not self.tracks or self.frames_since_search >= self.search_every:
+                self.searched_count += 1
+                self.frames_since_search = 0
+                unmatched = [t for t in self.tracks if t.id not in found]
+                for quad in self.detect(frame):
+                    track = self.match(quad, unmatched)
+                    if track is not None:
+                        unmatched.remove(track)
+                        found[track.id] = quad
+                    elif self.match(quad, [t for t in self.tracks if t.id in found]) is None:
+                        track = PlateTrack(next(self.ids), quad)
+                        self.tracks.append(track)
+                        found[track.id] = quad
+
+            for track in self.tracks:
+                if track.id in found:
+                    track.quad = found[track.id]
+                    track.lost_frames = 0
+                else:
+                    track.lost_frames += 1
+            self.tracks = [t for t in self.tracks if t.lost_frames <= self.max_lost]
+            return [(t.id, t.quad) for t in self.tracks if t.id in found]
+
+    def report(self):
+        """Summary of the plates tracked in their window, and of the full frame searches.
+
+        Returns:
+            str: the summary
+        """
+        with self.lock:
+            return f"plates tracked in window {self.tracked_count}, full frame searches {self.searched_count}"
@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+
+import queue
+import threading
+
+
+class RecognitionWorker:
+    """This class runs plate recognition jobs in the background, off the control loop.
+
+    Jobs are run in the order they are submitted. At most max_pending frame jobs (see submit) wait at a time:
+    when the worker falls behind, new ones are dropped (and counted) instead of piling up, so the recognition
+    never works on stale frames and never blocks the control loop. Calls that must not be lost (see submit_call)
+    are always queued, behind the jobs already waiting.
+    """
+
+    def __init__(self, handler, max_pending=2, num_threads=1):
+        """Creates a RecognitionWorker object and starts its threads.
+
+        Args:
+            handler (callable): function running one job, called with the arguments given to submit
+            max_pending (int, optional): max number of frame jobs waiting to be run. Defaults to 2.
+            num_threads (int, optional): number of worker threads. 0 runs each job right away on the thread 
+                calling submit (e.g. for a deterministic replay). Defaults to 1.
+        """
+        self.handler = handler
+        self.max_pending = max_pending
+        """(function, arguments, True for a frame job), the bound is on the frame jobs only"""
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        """frame jobs waiting to be run"""
+        self.pending_count = 0
+        """stats"""
+        self.submitted_count = 0
+        self.dropped_count = 0
+        self.completed_count = 0
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(num_threads)]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, *args):
+        """Queues a job, without blocking.
+
+        Args:
+            *args: arguments to call the handler with
+
+        Returns:
+            bool: True if queued, False if dropped because the queue is full.
+        """
+        if not self.threads:
+            with self.lock:
+                self.submitted_count += 1
+            self.run_job(self.handler, args)
+            return True
+        with self.lock:
+            if self.pending_count >= self.max_pending:
+                self.dropped_count += 1
+                return False
+            self.pending_count += 1
+            self.submitted_count += 1
+            self.jobs.put_nowait((self.handler, args, True))
+        return True
+
+    def submit_call(self, fn, *args):
+        """Queues a job calling another function than the handler (e.g. for a job finishing the work of the
+        previous ones), without blocking. Never dropped, and run after the jobs already waiting (so the
+        calls should be rare, e.g. once per plate pass).
+
+        Args:
+            fn (callable): function running the job
+            *args: arguments to call it with
+        """
+        if not self.threads:
+            with self.lock:
+                self.submitted_count += 1
+            self.run_job(fn, args)
+            return
+        with self.lock:
+            self.submitted_count += 1
+            self.jobs.put_nowait((fn, args, False))
+
+    def run(self):
+        """Worker thread loop, running the queued jobs until a None job is received."""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            fn, args, frame_job = job
+            if frame_job:
+                with self.lock:
+                    self.pending_count -= 1
+            try:
+                self.run_job(fn, args)
+            finally:
+                self.jobs.task_done()
+
+    def run_job(self, fn, args):
+        """Runs one job.
+
+        Args:
+            fn (callable): function running the job (the handler, unless given to submit_call)
+            args (tuple): arguments to call it with
+        """
+        try:
+            fn(*args)
+        except Exception as e:
+            print("recognition failed:", e)
+        finally:
+            with self.lock:
+                self.completed_count += 1
+
+    def join(self):
+        """Waits until every queued job has been run (e.g. before the predictions are used)."""
+        self.jobs.join()
+
+    def close(self):
+        """Stops the worker threads once the queued jobs have been run."""
+        for _ in self.threads:
+            self.jobs.put(None)
+
+    def report(self):
+        """Summary of the jobs submitted, dropped and completed.
+
+        Returns:
+            str: the summary
+        """
+        with self.lock:
+            return f"recognition jobs submitted {self.submitted_count}, completed {self.completed_count}, dropped {self.dropped_count}"
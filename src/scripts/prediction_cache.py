@@ -0,0 +1,186 @@
+#! /usr/bin/env python3
+
+import collections
+import itertools
+import threading
+import cv2
+import numpy as np
+
+"""size (width, height) of the thumbnail the hash compares neighbours on"""
+HASH_GRID = (9, 8)
+"""differences of neighbours within this many gray levels count as equal"""
+HASH_DEAD_BAND = 16.0
+"""differences within this many gray levels of the dead band are uncertain, and probed both ways"""
+HASH_MARGIN = 1.0
+"""max number of uncertain differences probed (up to 2**HASH_MAX_UNCERTAIN lookups)"""
+HASH_MAX_UNCERTAIN = 3
+"""max difference of any pixel (in gray levels) between an input and the input a cached prediction was made for.
+Crops of different characters in the bundled character data differ by 30 or more somewhere"""
+MAX_PIXEL_DIFF = 8
+"""max number of predictions kept per hash (for the different inputs sharing it)"""
+MAX_PER_HASH = 8
+
+
+def neighbour_diffs(img):
+    """Differences of horizontally adjacent cells of a small thumbnail of a grayscale image.
+
+    Args:
+        img (cv::Mat): grayscale image (e.g. a 15x29 character crop)
+
+    Returns:
+        ndarray: the differences (left minus right), flattened
+    """
+    small = cv2.resize(np.float32(img), HASH_GRID, interpolation=cv2.INTER_AREA)
+    return (small[:, :-1] - small[:, 1:]).ravel()
+
+
+def encode_hash(shape, codes):
+    """Returns:
+        bytes: the hash of ternary codes (1 left brighter, -1 right brighter, 0 about equal), with the shape
+            of the image so that different input sizes never collide
+    """
+    return bytes(shape) + np.packbits(codes > 0).tobytes() + np.packbits(codes < 0).tobytes()
+
+
+def perceptual_hash(img):
+    """Difference hash of a grayscale model input: the image is reduced to a 9x8 thumbnail (area averaged),
+    and each pair of horizontally adjacent cells is coded by which one is brighter, or as equal within
+    a dead band. Noise and small brightness shifts average out in the thumbnail and within the dead band,
+    so near identical crops of a character get the same hash, except when a difference is right at the
+    edge of the dead band (see perceptual_hash_probes).
+    The hash is coarse: crops of similar characters (e.g. E and F) can get the same hash too, so it is only used
+    to find the candidates (see PredictionCache).
+
+    Args:
+        img (cv::Mat): grayscale image (e.g. a 15x29 character crop)
+
+    Returns:
+        bytes: the hash
+    """
+    img = np.asarray(img)
+    diffs = neighbour_diffs(img)
+    codes = (diffs > HASH_DEAD_BAND).astype(np.int8) - (diffs < -HASH_DEAD_BAND)
+    return encode_hash(img.shape, codes)
+
+
+def perceptual_hash_probes(img):
+    """The perceptual hash of an image, and the hashes a near identical image could get: the differences closest
+    to the edge of the dead band (within HASH_MARGIN, at most HASH_MAX_UNCERTAIN of them) are coded both ways.
+
+    Args:
+        img (cv::Mat): grayscale image (e.g. a 15x29 character crop)
+
+    Returns:
+        list[bytes]: the hashes, perceptual_hash(img) first
+    """
+    img = np.asarray(img)
+    diffs = neighbour_diffs(img)
+    codes = (diffs > HASH_DEAD_BAND).astype(np.int8) - (diffs < -HASH_DEAD_BAND)
+    distance = np.abs(np.abs(diffs) - HASH_DEAD_BAND)
+    nearest = np.argsort(distance)[:HASH_MAX_UNCERTAIN]
+    uncertain = nearest[distance[nearest] < HASH_MARGIN]
+    # the other code of an uncertain difference: equal if it was not, else the sign of the difference
+    other = np.where(codes[uncertain] == 0, np.sign(diffs[uncertain]), 0).astype(np.int8)
+    hashes = []
+    for flips in itertools.product((False, True), repeat=len(uncertain)):
+        probe = codes.copy()
+        probe[uncertain] = np.where(flips, other, codes[uncertain])
+        hashes.append(encode_hash(img.shape, probe))
+    return hashes
+
+
+class PredictionCache:
+    """This class is a bounded LRU cache of model predictions, keyed by the model and the perceptual hash
+    of the input, so that repeated crops (e.g. while stopped or crawling past a plate) skip the model.
+    A prediction is stored under the hash of its input, and looked up under the probes of the hash of the
+    new input (see perceptual_hash_probes). The hash only narrows down the candidates: crops of similar
+    characters (e.g. E and F) can share it, so a prediction is only returned if the input it was made for is
+    the same as the new input, within MAX_PIXEL_DIFF on every pixel.
+    """
+
+    def __init__(self, capacity=4096, max_pixel_diff=MAX_PIXEL_DIFF):
+        """Creates a PredictionCache object.
+
+        Args:
+            capacity (int, optional): max number of hashes kept, 0 to disable the cache. Defaults to 4096.
+            max_pixel_diff (int, optional): max difference of any pixel between the inputs of a hit. Defaults to MAX_PIXEL_DIFF.
+        """
+        self.capacity = capacity
+        self.max_pixel_diff = max_pixel_diff
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        """stats"""
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    def keys(self, model_key, img):
+        """Returns:
+            list[tuple]: the cache keys a model input is looked up under, the one to store its prediction under first
+        """
+        return [(model_key, h) for h in perceptual_hash_probes(img)]
+
+    def get(self, keys, img):
+        """Looks up a prediction, marking it as the most recently used.
+
+        Args:
+            keys (list[tuple]): cache keys of the input (see keys)
+            img (cv::Mat): the input
+
+        Returns:
+            ndarray: the cached prediction vector, None if not cached
+        """
+        img = np.asarray(img)
+        with self.lock:
+            for key in keys:
+                for cached_img, pred in self.entries.get(key, ()):
+                    if cached_img.shape != img.shape or cv2.norm(cached_img, img, cv2.NORM_INF) > self.max_pixel_diff:
+                        # same hash, but another input (e.g. a similar character)
+                        self.rejected += 1
+                        continue
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return pred
+            self.misses += 1
+            return None
+
+    def put(self, key, img, pred):
+        """Caches a prediction, evicting the least recently used hashes beyond the capacity, and the oldest
+        prediction of the hash beyond MAX_PER_HASH.
+
+        Args:
+            key (tuple): cache key (the first of keys)
+            img (cv::Mat): the input the prediction was made for
+            pred (ndarray): prediction vector
+        """
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            entry = self.entries.setdefault(key, [])
+            entry.insert(0, (np.array(img), pred))
+            del entry[MAX_PER_HASH:]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def report(self):
+        """Summary of the hits, misses (and the hash matches rejected by the pixel check) and evictions.
+
+        Returns:
+            str: the summary
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            rate = 100.0 * self.hits / total if total else 0
+            return (f"prediction cache {len(self.entries)}/{self.capacity} entries, hits {self.hits} ({rate:.1f}%), "
+                    f"misses {self.misses} (rejected {self.rejected}), evictions {self.evictions}")
+
+
+"""process-wide cache shared by the character readers (the model is part of the key)"""
+PREDICTION_CACHE = PredictionCache()
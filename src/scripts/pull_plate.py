@@ -1,7 +1,6 @@
 #! /usr/bin/env python3
 
 from __future__ import print_function
-from concurrent.futures import process
 
 #import roslib; roslib.load_manifest('node')
 import sys
@@ -12,7 +11,10 @@ import numpy as np
 from sensor_msgs.msg import Image
 from cv_bridge import CvBridge, CvBridgeError
 from char_reader import CharReader
-from plate_reader import PlateReader
+from plate_reader import READER_BACKEND
+from contour_stats import top_areas, top_contours
+import plate_geometry
+from plate_geometry import CAR_WIDTH, CAR_HEIGHT
 
 
 """
@@ -35,8 +37,6 @@ lv = 90
 lower_hsv = np.array([lh, ls, lv])
 upper_hsv = np.array([uh, us, uv])
 
-CAR_WIDTH = 200
-CAR_HEIGHT = 320
 PLATE_F = 270
 PLATE_I = 220
 PLATE_RES = (150, 298)
@@ -57,7 +57,7 @@ class PlatePull:
         self.bridge = CvBridge()
         self.image_sub = rospy.Subscriber(
             "/R1/pi_camera/image_raw", Image, self.callback)
-        self.id_reader = CharReader(PATH_PARKING_ID)
+        self.id_reader = CharReader(PATH_PARKING_ID, READER_BACKEND)
         self.i = 0
 
     def process_stream(self, image):
@@ -83,28 +83,16 @@ class PlatePull:
         Returns:
             list(float): the top contour areas, sorted in descending order
         """        
-        contours, hierarchy = cv2.findContours(
-            image=img, mode=cv2.RETR_TREE, method=cv2.CHAIN_APPROX_NONE)
-        cs = sorted(contours, key=cv2.contourArea, reverse=True)
-        if len(cs) > nums:
-            cs = cs[:nums]
-        areas = [cv2.contourArea(c) for c in cs] 
-        return areas
+        return top_areas(img, nums)
 
     def get_moments(self, img):
         """Returns c, cx, cy. (Usually cx, cy are only important for debugging text)
         c is the largest contour; 
         cx, cy is the center of mass of the largest contour"""
-        contours, hierarchy = cv2.findContours(
-            image=img, mode=cv2.RETR_TREE, method=cv2.CHAIN_APPROX_NONE)
+        stats = top_contours(img)
+        cx, cy = stats.centroid()
 
-        # gets the biggest contour and its info
-        c = max(contours, key=cv2.contourArea)
-        M = cv2.moments(c)
-        cx = int(M['m10']/M['m00'])
-        cy = int(M['m01']/M['m00'])
-
-        return  c, cx, cy
+        return  stats.largest, cx, cy
 
     def callback(self, data):
         try:
@@ -123,14 +111,9 @@ class PlatePull:
 
         # approximates the contour to a simpler shape
         epsilon = 0.1  # higher means simplify more
-        perimiter = cv2.arcLength(c, True)
-        approx = cv2.approxPolyDP(c, epsilon*perimiter, True)
-
-        n = approx.ravel()
-        pts = np.float32(self.get_coords(n)).reshape(-1, 2)
-        # sorted_pts = self.contour_coords_sorted(pts)
-        sorted_pts = PlateReader.contour_coords_sorted(pts)
-        if not list(sorted_pts):
+        approx = plate_geometry.approximate(c, epsilon)
+        sorted_pts = plate_geometry.order_corners(plate_geometry.corners(approx))
+        if sorted_pts is None:
             return
         cv2.putText(disp, "tl", (int(sorted_pts[0][0]), int(
             sorted_pts[0][1])), font, font_size, (0, 255, 0))
@@ -213,53 +196,7 @@ class PlatePull:
                  Desired width and height of the transformed image.
                  The image from which we pull the polygon.
                  Returns: The polygon from the original image transformed into a square."""
-        pts = np.float32([[0, 0], [width, 0],
-                          [0, height], [width, height]])
-        Mat = cv2.getPerspectiveTransform(sorted_pts, pts)
-        return cv2.warpPerspective(image, Mat, (width, height))
-
-    def get_coords(self, contour):
-        """Args: Approximated contour extracted with CHAIN_APPROX_NONE (only the verticies)
-           Returns: List of verticies in (x,y) coords"""
-        i = 0
-        coords = []
-        for j in contour:
-            if (i % 2 == 0):
-                x = contour[i]
-                y = contour[i + 1]
-                coords.append((x, y))
-
-            i = i + 1
-
-        return coords
-
-    def contour_coords_sorted(self, list_of_points):
-        """Args: List of contour verticies
-           Returns: Verticies in list sorted by top to bottom, left to right"""
-
-        avg_y = 0
-        avg_x = 0
-
-        for i in list_of_points:
-            avg_y += i[1]
-            avg_x += i[0]
-
-        avg_y = int(avg_y/4)
-        avg_x = int(avg_x/4)
-        tl = tr = bl = br = None
-        for i in list_of_points:
-            if (int(i[1]) < avg_y and int(i[0]) < avg_x):
-                tl = i
-            elif (int(i[1]) < avg_y):
-                tr = i
-            elif (int(i[0]) < avg_x):
-                bl = i
-            else:
-                br = i
-
-        coords = [list(tl), list(tr), list(bl), list(br)]
-
-        return np.float32(coords).reshape(-1, 2)
+        return plate_geometry.warp_plate(image, sorted_pts, width, height)
 
 
 def main(args):
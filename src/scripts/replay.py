@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import tarfile
+import time
+import zipfile
+import cv2
+import numpy as np
+
+import ros_shim
+ros_shim.install()
+
+import plate_reader
+from driver import Driver
+from gating import GATES
+from latency import LATENCY
+
+"""
+Offline replay of recorded camera frames through the Driver state machine, without ros or gazebo.
+
+Frames are fed as fast as the cpu allows, on a replay clock advancing 1/fps per frame (so that
+OUTSIDE_LOOP_SECS / END_SECS follow replay time), and every cmd_vel and /license_plate message is
+recorded. e.g.:
+    python3 replay.py ~/lap-frames/ --out lap.json --models-dir ~/models/
+The models are looked up in --models-dir (or $REPLAY_MODELS_DIR) by the file names the driver uses, instead of
+the paths of the robot's machine.
+"""
+
+IMG_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+"""environment variable giving the default models folder"""
+MODELS_DIR_ENV = 'REPLAY_MODELS_DIR'
+
+
+def use_models_dir(models_dir):
+    """Points the drive models (Driver.MODEL_PATH, Driver.INNER_MOD_PATH) and the character models of the
+    plate reader (plate_reader.PATH_*) to the files of the same name in a folder. Must be called before the
+    Driver is created.
+
+    Args:
+        models_dir (str): folder of the models
+    """
+    def moved(path):
+        return os.path.join(os.path.expanduser(models_dir), os.path.basename(path))
+    Driver.MODEL_PATH = moved(Driver.MODEL_PATH)
+    Driver.INNER_MOD_PATH = moved(Driver.INNER_MOD_PATH)
+    plate_reader.PATH_NUM_MODEL = moved(plate_reader.PATH_NUM_MODEL)
+    plate_reader.PATH_ALPHA_MODEL = moved(plate_reader.PATH_ALPHA_MODEL)
+    plate_reader.PATH_PARKING_ID = moved(plate_reader.PATH_PARKING_ID)
+
+
+class ReplayClock:
+    """This class is the clock of a replay: time advances by one frame interval per frame, not with the wall clock.
+    """
+
+    def __init__(self, fps):
+        """Creates a ReplayClock object, starting at 0.
+
+        Args:
+            fps (float): frame rate the frames were recorded at
+        """
+        self.t = 0.0
+        self.dt = 1.0 / fps
+
+    def __call__(self):
+        """Returns:
+            float: the current replay time in seconds
+        """
+        return self.t
+
+    def tick(self):
+        """Advances the clock by one frame."""
+        self.t += self.dt
+
+
+class RecordingPublisher:
+    """This class stands in for a ros publisher, recording every published message instead.
+    """
+
+    def __init__(self, to_record):
+        """Creates a RecordingPublisher object.
+
+        Args:
+            to_record (callable): converts a message to the record to keep (messages are mutated after publishing)
+        """
+        self.to_record = to_record
+        self.records = []
+        self.frame = 0
+        self.t = 0.0
+
+    def publish(self, msg):
+        record = {"frame": self.frame, "t": round(self.t, 4)}
+        record.update(self.to_record(msg))
+        self.records.append(record)
+
+
+def natural_key(name):
+    """Sorts file names by the numbers in them (i.e. 2 before 10)."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def iter_frames(path):
+    """Yields the recorded BGR frames, in order.
+
+    Args:
+        path (str): a folder of images, a .zip / .tar(.gz) archive of images, or a .npy / .npz array of frames
+
+    Yields:
+        cv::Mat: BGR frame
+    """
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path), key=natural_key):
+            if filename.lower().endswith(IMG_EXTENSIONS):
+                yield cv2.imread(os.path.join(path, filename))
+    elif path.endswith('.npy'):
+        yield from np.load(path, mmap_mode='r')
+    elif path.endswith('.npz'):
+        with np.load(path) as archive:
+            for key in sorted(archive.files, key=natural_key):
+                yield from archive[key] if archive[key].ndim == 4 else [archive[key]]
+    elif path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist(), key=natural_key):
+                if name.lower().endswith(IMG_EXTENSIONS):
+                    yield cv2.imdecode(np.frombuffer(archive.read(name), np.uint8), cv2.IMREAD_COLOR)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            members = [m for m in archive.getmembers() if m.isfile() and m.name.lower().endswith(IMG_EXTENSIONS)]
+            for member in sorted(members, key=lambda m: natural_key(m.name)):
+                data = archive.extractfile(member).read()
+                yield cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    else:
+        raise ValueError(f"Unsupported frames source: {path}")
+
+
+def replay(path, fps=Driver.FPS, max_frames=None, quiet=True, models_dir=None):
+    """Feeds recorded frames through a Driver, on the replay clock.
+
+    Args:
+        path (str): recorded frames (see iter_frames)
+        fps (float, optional): frame rate the frames were recorded at. Defaults to Driver.FPS.
+        max_frames (int, optional): stop after this many frames. Defaults to None (all frames).
+        quiet (bool, optional): True to silence the driver's prints. Defaults to True.
+        models_dir (str, optional): folder of the models (see use_models_dir). Defaults to None (the driver's paths).
+
+    Returns:
+        dict: the summary of the replay, every cmd_vel and license plate message, and the latency stats
+    """
+    clock = ReplayClock(fps)
+    twist_pub = RecordingPublisher(lambda msg: {"x": round(msg.linear.x, 4), "z": round(msg.angular.z, 4)})
+    license_pub = RecordingPublisher(lambda msg: {"data": msg.data})
+    out = io.StringIO() if quiet else None
+    if models_dir:
+        use_models_dir(models_dir)
+
+    with contextlib.redirect_stdout(out) if quiet else contextlib.nullcontext():
+        driver = Driver(live=False, clock=clock, twist_pub=twist_pub, license_pub=license_pub)
+        start = time.perf_counter()
+        num_frames = 0
+        for frame in iter_frames(path):
+            if max_frames is not None and num_frames >= max_frames:
+                break
+            for pub in (twist_pub, license_pub):
+                pub.frame = num_frames
+                pub.t = clock()
+            LATENCY.state = driver.state_name()
+            with LATENCY.stage("frame"):
+                driver.process_frame(np.ascontiguousarray(frame))
+            if out is not None:
+                # the driver prints on every frame, do not keep it all
+                out.seek(0)
+                out.truncate()
+            clock.tick()
+            num_frames += 1
+        wall_secs = time.perf_counter() - start
+
+    return {
+        "frames": num_frames,
+        "replay_secs": round(clock(), 3),
+        "wall_secs": round(wall_secs, 3),
+        "fps": round(num_frames / wall_secs, 2) if wall_secs else 0,
+        "final_state": driver.state_name(),
+        "results": driver.results,
+        "cmd_vel": twist_pub.records,
+        "license_plate": license_pub.records,
+        "latency": LATENCY.stats(),
+        "gating": GATES.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays recorded frames through the Driver, without ros.')
+    parser.add_argument('frames', help='folder or archive (.zip, .tar, .npy, .npz) of recorded BGR frames')
+    parser.add_argument('--fps', type=float, default=Driver.FPS, help='frame rate the frames were recorded at')
+    parser.add_argument('--max-frames', type=int, default=None, help='stop after this many frames')
+    parser.add_argument('--out', default=None, help='json file to write the recorded outputs to')
+    parser.add_argument('--verbose', action='store_true', help="show the driver's prints")
+    parser.add_argument('--show', action='store_true', help="show the driver's debug windows")
+    parser.add_argument('--models-dir', default=os.environ.get(MODELS_DIR_ENV),
+                        help=f'folder of the drive and character models, by file name. Defaults to ${MODELS_DIR_ENV}, '
+                             "else the driver's paths")
+    args = parser.parse_args()
+
+    Driver.SHOW_DEBUG = args.show
+    result = replay(args.frames, args.fps, args.max_frames, quiet=not args.verbose, models_dir=args.models_dir)
+    print(f"{result['frames']} frames ({result['replay_secs']} s of replay time) in {result['wall_secs']} s: "
+          f"{result['fps']} fps, {result['fps'] / args.fps:.1f}x real time")
+    print(f"final state: {result['final_state']}, {len(result['cmd_vel'])} cmd_vel, {len(result['license_plate'])} license plate messages")
+    for stage in result['gating']:
+        print(f"  {stage['stage']:<16} passed {stage['passed']:>6}  rejected {stage['rejected']:>6}")
+    for record in result['license_plate']:
+        print(f"  frame {record['frame']:>6}  {record['data']}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
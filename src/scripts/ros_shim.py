@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+
+import sys
+import types
+
+"""
+Minimal stand-ins for the ros modules the perception and driving code imports (rospy, cv_bridge and
+the geometry_msgs / sensor_msgs / std_msgs messages), so that it can run on a machine without ros
+(e.g. replay.py on a headless machine). Only installed when ros itself cannot be imported.
+"""
+
+
+class _Vector3:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class Twist:
+    def __init__(self):
+        self.linear = _Vector3()
+        self.angular = _Vector3()
+
+
+class String:
+    def __init__(self, data=""):
+        self.data = data
+
+
+class Image:
+    pass
+
+
+class CvBridgeError(Exception):
+    pass
+
+
+class CvBridge:
+    def imgmsg_to_cv2(self, img_msg, desired_encoding="passthrough"):
+        """Messages are already cv images when running without ros."""
+        return img_msg
+
+
+class Publisher:
+    def __init__(self, name, data_class, queue_size=None, callback=None):
+        """Publishes to a callback instead of a ros topic.
+
+        Args:
+            name (str): name of the topic
+            data_class (type): type of the messages
+            callback (callable, optional): called with each published message. Defaults to None (discarded).
+        """
+        self.name = name
+        self.callback = callback
+
+    def publish(self, msg):
+        if self.callback is not None:
+            self.callback(msg)
+
+
+class _NoOp:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def sleep(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class ROSInterruptException(Exception):
+    pass
+
+
+def installed():
+    """Returns:
+        bool: True if ros can be imported (i.e. the shim is not needed)
+    """
+    try:
+        import rospy
+        return not getattr(rospy, "IS_SHIM", False)
+    except ImportError:
+        return False
+
+
+def install():
+    """Registers the stand-in modules in sys.modules, unless ros can be imported."""
+    if installed() or "rospy" in sys.modules:
+        return
+
+    rospy = types.ModuleType("rospy")
+    rospy.IS_SHIM = True
+    rospy.Publisher = Publisher
+    rospy.Subscriber = _NoOp
+    rospy.Rate = _NoOp
+    rospy.Timer = _NoOp
+    rospy.Duration = _NoOp
+    rospy.ROSInterruptException = ROSInterruptException
+    rospy.init_node = lambda *args, **kwargs: None
+    rospy.on_shutdown = lambda hook: None
+    rospy.is_shutdown = lambda: False
+    rospy.spin = lambda: None
+
+    cv_bridge = types.ModuleType("cv_bridge")
+    cv_bridge.CvBridge = CvBridge
+    cv_bridge.CvBridgeError = CvBridgeError
+
+    modules = {"rospy": rospy, "cv_bridge": cv_bridge}
+    for package, classes in (("geometry_msgs", {"Twist": Twist}),
+                             ("sensor_msgs", {"Image": Image}),
+                             ("std_msgs", {"String": String})):
+        msg = types.ModuleType(package + ".msg")
+        for name, cls in classes.items():
+            setattr(msg, name, cls)
+        pkg = types.ModuleType(package)
+        pkg.msg = msg
+        modules[package] = pkg
+        modules[package + ".msg"] = msg
+    sys.modules.update(modules)
@@ -7,7 +7,6 @@ import sys
 import rospy
 import cv2
 import os
-from scrape_cmd import CmdScraper
 from hsv_view import ImageProcessor
 from std_msgs.msg import String
 from sensor_msgs.msg import Image
@@ -77,14 +76,49 @@ class DataScraper:
         self.twist = (data.linear.x, data.angular.z, data.linear.z)
 
     @staticmethod
-    def process_img(img, type='bgr'):
+    def process_img(img, type='bgr', downscale_first=False):
         """Processes the raw image data to a format compatible for the cnn.
 
         Args:
             img (cv::Mat): raw image to be processed.
+            type (str): (Optional) the channel type of the image data. Assumed to be "bgr"
+            downscale_first (bool): (Optional) True to crop the raw image before filtering and compressing it, 
+                so that only the rows the cnn sees are filtered. Gives the same masks as filtering the full 
+                image (see check_preprocessing.py). Defaulted to False.
         """
+        if downscale_first:
+            return DataScraper.process_img_downscaled(img, type)
         hsv = ImageProcessor.filter(img, ImageProcessor.white_low, ImageProcessor.white_up, type)
-        hsv = DataScraper.compress(hsv, DataScraper.COMPRESSION_RATIO)
+        return DataScraper.process_mask(hsv)
+
+    @staticmethod
+    def process_img_downscaled(img, type='bgr'):
+        """Same as process_img, but crops the raw image first, so that only the rows the cnn sees are 
+        converted to hsv and filtered (half of a 1280x720 frame), before the mask is compressed.
+        The mask is filtered before it is compressed, like in process_img: compressing the raw image first 
+        averages the colours of neighbouring pixels before they are thresholded, which does not give the 
+        masks the cnn was trained on. The compression (with the same scale factors) then samples the same 
+        pixels of the blurred mask, so the result is the same.
+
+        Args:
+            img (cv::Mat): raw image to be processed.
+            type (str): (Optional) the channel type of the image data. Assumed to be "bgr"
+        """
+        ratio = DataScraper.COMPRESSION_RATIO
+        # the blur only reaches one row above the first sampled row (row_start + 1), which is within the crop
+        crped = ImageProcessor.crop(img, row_start=int(round(DataScraper.CROPPED_ROW_START/ratio)))
+        mask = ImageProcessor.filter(crped, ImageProcessor.white_low, ImageProcessor.white_up, type)
+        return DataScraper.compress(mask, ratio)
+
+    @staticmethod
+    def process_mask(mask):
+        """Same as process_img, but for an image that has already been filtered to the white mask
+        (e.g. FrameContext.mask("white")).
+
+        Args:
+            mask (cv::Mat): full resolution white mask of the raw image.
+        """
+        hsv = DataScraper.compress(mask, DataScraper.COMPRESSION_RATIO)
         hsv = ImageProcessor.crop(hsv, row_start=DataScraper.CROPPED_ROW_START)
         return hsv
 
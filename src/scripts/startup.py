@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class StartupTimer:
+    """This class records how long each part of a node's startup takes, so that it can be
+    printed as a breakdown once the node is ready.
+    """
+
+    def __init__(self):
+        """Creates a StartupTimer object. Times are relative to its creation."""
+        self.start = time.perf_counter()
+        self.last_mark = self.start
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def mark(self, name):
+        """Records a phase that ran (sequentially) since the previous mark.
+
+        Args:
+            name (str): name of the phase
+        """
+        now = time.perf_counter()
+        with self.lock:
+            self.phases.append((name, now - self.last_mark))
+            self.last_mark = now
+
+    def phase(self, name):
+        """Context manager recording the time spent in its block. Can be used from several threads at once.
+
+        Args:
+            name (str): name of the phase
+        """
+        return _Phase(self, name)
+
+    def report(self):
+        """Prints the startup-time breakdown."""
+        total = time.perf_counter() - self.start
+        print("------STARTUP TIME-------")
+        with self.lock:
+            for name, secs in self.phases:
+                print(f"{name:<32}{secs*1000:>10.1f} ms")
+        print(f"{'total':<32}{total*1000:>10.1f} ms")
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        with self.timer.lock:
+            self.timer.phases.append((self.name, time.perf_counter() - self.start))
+        self.timer.last_mark = time.perf_counter()
+        return False
+
+
+"""process-wide timer, started when the first perception module is imported"""
+STARTUP = StartupTimer()
+
+
+def warmup(predictor):
+    """Runs one inference on a dummy input of the right shape, so that graph tracing and
+    allocation are paid at startup instead of on the first real frame.
+
+    Args:
+        predictor (KerasPredictor, FastPredictor, TFLitePredictor or RemotePredictor): predictor to warm up
+    """
+    predictor.predict(np.zeros((1,) + tuple(predictor.input_shape), dtype=np.float32))
+
+
+def load_parallel(loaders, timer=STARTUP):
+    """Loads several models concurrently (model loading mostly releases the GIL in tensorflow / h5py),
+    warming up each one as soon as it is loaded.
+
+    Args:
+        loaders (dict[str, callable]): name -> function creating an object holding a model as its predictor attribute (e.g. Model, CharReader)
+        timer (StartupTimer, optional): timer to record each load and warm-up in. Defaults to STARTUP.
+
+    Returns:
+        dict[str, object]: name -> created object
+    """
+    def load(name, loader):
+        with timer.phase(f"load {name}"):
+            obj = loader()
+        with timer.phase(f"warm up {name}"):
+            warmup(obj.predictor)
+        return obj
+
+    with ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+        futures = {name: executor.submit(load, name, loader) for name, loader in loaders.items()}
+        return {name: future.result() for name, future in futures.items()}